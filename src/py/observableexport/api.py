@@ -1,9 +1,40 @@
 from .model import Notebook, Cell, NotebookRef, NotebookHeader
 from .parser import NotebookParser
-from typing import Optional, Iterator, Union, Generic, TypeVar, cast
-import requests
+from .selector import Selector
+from .profiling import span, timed
+from .metrics import Metrics, endpoint
+from .scheduler import Scheduler, SingleFlight
+from .diff import Change, diff
+from .lock import Lockfile
+from .cache import (
+    Cache,
+    MemoryCache,
+    DirectoryCache,
+    LRUCache,
+    CHUNK_SIZE,
+    iterlines,
+)
+from .output import copy
+from typing import (
+    Optional,
+    Iterator,
+    Iterable,
+    Union,
+    Generic,
+    TypeVar,
+    BinaryIO,
+    Callable,
+    Any,
+    cast,
+)
+from contextlib import contextmanager
 import os
+import sys
 import json
+import hashlib
+import time
+import mmap
+import re
 
 # TODO: Support caching
 # TODO: Support request ETag
@@ -12,6 +43,45 @@ import json
 
 T = TypeVar("T")
 OBSERVABLE_API_KEY = "OBSERVABLE_API_KEY"
+# The directory of the cache shared by concurrent processes, if any
+OBSERVABLE_CACHE = "OBSERVABLE_CACHE"
+# The size of the chunks read when we only need the header of an export
+HEADER_CHUNK_SIZE = 512
+# The maximum number of parsed notebooks kept in memory
+PARSED_LIMIT = 128
+# The prefixes of the URLs whose responses don't depend on the credential:
+# public notebooks and their documents.
+SHARED = ("@", "document/@")
+# The time (in seconds) after which the persisted responses that change over
+# time (latest versions, listings) are fetched again.
+MUTABLE_TTL = 300.0
+# The cache keys of versioned responses, which never change
+RE_IMMUTABLE = re.compile(r"@\d+(\.js)?(#[0-9a-f]+)?$")
+
+
+def isImmutable(cache_key: str) -> bool:
+    """Tells if the cached response doesn't change over time, which is
+    the case of the exports and documents of a given notebook version."""
+    return bool(RE_IMMUTABLE.search(cache_key))
+
+
+def directory_cache(path: str, level: int = 6) -> DirectoryCache:
+    """Returns a cache persisted in the given directory, whose mutable
+    entries expire after `MUTABLE_TTL` seconds."""
+    return DirectoryCache(path, level, ttl=MUTABLE_TTL, isImmutable=isImmutable)
+
+
+def readHeader(lines: Iterable[str]) -> str:
+    """Returns the header comments of a JavaScript export, up to and
+    including the `// Version:` line, without consuming the rest."""
+    header: list[str] = []
+    for line in lines:
+        if not line.startswith("//"):
+            break
+        header.append(line)
+        if line.startswith("// Version:"):
+            break
+    return "".join(header)
 
 
 class Singleton(Generic[T]):
@@ -33,10 +103,23 @@ class Singleton(Generic[T]):
 class ObservableAPI(Singleton["ObservableAPI"]):
     """The baseline Observable API"""
 
-    def __init__(self, key: Optional[str] = None):
+    def __init__(self, key: Optional[str] = None, compression: int = 6):
         super().__init__
         self.apikey: Optional[str] = key
-        self.cache: dict[str, str] = {}
+        # Responses are cached compressed with the given zlib level, in a
+        # directory shared by concurrent processes when configured.
+        cache_path = os.getenv(OBSERVABLE_CACHE)
+        self.cache: Cache = (
+            directory_cache(cache_path, compression)
+            if cache_path
+            else MemoryCache(compression)
+        )
+        self.metrics: Metrics = Metrics()
+        self.scheduler: Scheduler = Scheduler(metrics=self.metrics)
+        self.flights: SingleFlight = SingleFlight(metrics=self.metrics)
+        # Maps URLs to their canonical cache key, and whether the entry is
+        # shared by all credentials.
+        self.aliases: dict[str, tuple[str, bool]] = {}
 
     def key(self, variable=OBSERVABLE_API_KEY) -> str:
         return (os.getenv(variable) or "").strip("\n").strip()
@@ -44,20 +127,185 @@ class ObservableAPI(Singleton["ObservableAPI"]):
     def url(self, path: str) -> str:
         return f"https://api.observablehq.com/{path}"
 
+    def cacheKey(self, url: str, key: Optional[str] = None) -> str:
+        """Returns the key of the cache entry for the given URL. Equivalent
+        URLs are aliased to the same canonical key, and the entries of
+        requests that depend on the credential are partitioned by a hash of
+        the API key, so that tenants never share private content."""
+        canonical, shared = self.aliases.get(url) or (url, url.startswith(SHARED))
+        api_key = key or self.key()
+        if shared or not api_key:
+            return canonical
+        credential = hashlib.sha256(api_key.encode("utf8")).hexdigest()[:16]
+        return f"{canonical}#{credential}"
+
+    def alias(
+        self, url: str, canonical: str, shared: bool = False
+    ) -> "ObservableAPI":
+        """Makes the given URL share the cache entry with the given canonical
+        key, which is `shared` by all credentials when its content doesn't
+        depend on the credential."""
+        self.aliases[url] = (canonical, shared)
+        return self
+
+    def isCached(self, url: str, key: Optional[str] = None) -> bool:
+        return self.cacheKey(url, key) in self.cache
+
+    def ensure(self, url: str, key: Optional[str] = None) -> str:
+        """Makes sure the response to the given URL is cached, returning the
+        key of its cache entry."""
+        cache_key = self.cacheKey(url, key)
+        if cache_key in self.cache:
+            self.metrics.hit("response")
+        else:
+            # Concurrent requests for the same entry share a single download.
+            # The entry is checked again within the flight, as a flight that
+            # just completed may have filled it.
+            self.flights.run(
+                cache_key,
+                lambda: cache_key in self.cache or self.fetch(url, key),
+            )
+        return cache_key
+
+    def refresh(self, url: str, key: Optional[str] = None) -> str:
+        """Like `ensure`, but fetches the response again when its entry
+        expired right after being ensured, returning the key of its cache
+        entry."""
+        cache_key = self.ensure(url, key)
+        if cache_key not in self.cache:
+            self.fetch(url, key)
+        return cache_key
+
     def request(self, url: str, key: Optional[str] = None) -> str:
-        if url in self.cache:
-            return self.cache[url]
+        cache_key = self.ensure(url, key)
+        # NOTE: Mutable entries may expire between `ensure` and `get`, in
+        # which case they are fetched again.
+        if (text := self.cache.get(cache_key)) is None:
+            self.fetch(url, key)
+            text = self.cache.get(cache_key)
+        if text is None:
+            raise RuntimeError(f"Response to {url} is missing from the cache")
+        return text
+
+    def lines(self, url: str, key: Optional[str] = None) -> Iterator[str]:
+        """Returns the lines of the response to the given URL. Cached
+        responses are decompressed as a stream, without being decoded as a
+        whole."""
+        return self.cache.lines(self.refresh(url, key))
+
+    def stream(self, url: str, out: BinaryIO, key: Optional[str] = None) -> int:
+        """Writes the response to the given URL to the binary file `out`, in
+        constant memory. The response is copied chunk by chunk from the
+        cache, or with `sendfile` when the cache holds it uncompressed on
+        disk. Returns the number of bytes written."""
+        cache_key = self.refresh(url, key)
+        with span("api.stream") as s:
+            if path := self.cache.file(cache_key):
+                written = copy(path, out)
+            else:
+                written = 0
+                for chunk in self.cache.chunks(cache_key):
+                    out.write(chunk)
+                    written += len(chunk)
+            s.add(written)
+        self.metrics.inc("bytes.streamed", written)
+        return written
+
+    def fetch(self, url: str, key: Optional[str] = None):
+        """Downloads the given URL into the cache."""
+        cache_key = self.cacheKey(url, key)
+        with self.cache.lock(cache_key):
+            # Another process may have filled the entry while we were
+            # waiting for the lock.
+            if cache_key in self.cache:
+                self.metrics.hit("response")
+                return
+            self.download(url, key)
+
+    def download(self, url: str, key: Optional[str] = None):
+        """Downloads the given URL and streams the response body into the
+        cache, chunk by chunk, so that it's never held as a whole."""
+        self.metrics.miss("response")
+        with self.response(url, key) as chunks:
+            with self.cache.writer(self.cacheKey(url, key)) as write:
+                for chunk in chunks():
+                    write(chunk)
+
+    def header(self, url: str, key: Optional[str] = None) -> str:
+        """Returns the header comments of the JavaScript export at the given
+        URL, up to the `// Version:` line. Only the first bytes of the
+        response are downloaded when it's not cached."""
+        if (cache_key := self.cacheKey(url, key)) in self.cache:
+            self.metrics.hit("response")
+            return readHeader(self.cache.lines(cache_key))
+        self.metrics.inc("headers")
+        with self.response(url, key) as chunks:
+            return readHeader(iterlines(chunks(HEADER_CHUNK_SIZE)))
+
+    def send(self, url: str, headers: dict[str, str]) -> Any:
+        """Sends a streamed GET request to the given absolute URL and returns
+        the `requests` response, which is not read yet."""
+        # NOTE: `requests` is imported lazily as it's the single most
+        # expensive import, and fully cached runs don't need it.
+        import requests
+
+        return requests.get(url, headers=headers, stream=True)
+
+    @contextmanager
+    def response(
+        self, url: str, key: Optional[str] = None
+    ) -> Iterator[Callable[..., Iterator[bytes]]]:
+        """Sends a streamed request to the given URL and yields a function
+        that iterates on the decoded chunks of the response body, of the
+        given size. The response is closed on exit, even when it's not fully
+        read. Raises a `RuntimeError` when the request failed."""
         api_key: str = key or self.key()
         abs_url = self.url(url)
         headers = {"Authorization": f"ApiKey {api_key}"} if api_key else {}
-        r = requests.get(abs_url, headers=headers)
-        if r.status_code >= 200 and r.status_code < 300:
-            self.cache[url] = r.text
-            return r.text
-        else:
-            raise RuntimeError(
-                f"Request to {url} failed with {r.status_code}: {r.text}"
-            )
+        headers["Accept-Encoding"] = "gzip, deflate"
+
+        def send():
+            started = time.perf_counter()
+            r = self.send(abs_url, headers)
+            self.metrics.latency(endpoint(url), time.perf_counter() - started)
+            self.metrics.inc("requests")
+            return r
+
+        # The scheduler takes care of rate limiting and of retrying throttled
+        # requests, and the request counts against its concurrency limit
+        # until the response is closed.
+        with span("api.request") as s, self.scheduler.running(send) as r:
+            with r:
+                if r.status_code < 200 or r.status_code >= 300:
+                    self.metrics.inc(f"errors.{r.status_code}")
+                    raise RuntimeError(
+                        f"Request to {url} failed with {r.status_code}: {r.text}"
+                    )
+                decoded: int = 0
+
+                def chunks(size: int = CHUNK_SIZE) -> Iterator[bytes]:
+                    nonlocal decoded
+                    for chunk in r.iter_content(size):
+                        decoded += len(chunk)
+                        yield chunk
+
+                try:
+                    yield chunks
+                finally:
+                    # We check that the transfer was actually compressed, in
+                    # which case the bytes downloaded are less than the
+                    # decoded bytes.
+                    encoding = r.headers.get("Content-Encoding") or "identity"
+                    # NOTE: The raw response tells how many bytes were read
+                    # off the wire, before decompression.
+                    tell = getattr(r.raw, "tell", None)
+                    wire = (
+                        tell() if tell and encoding != "identity" else 0
+                    ) or decoded
+                    self.metrics.inc(f"transfer.{encoding}")
+                    self.metrics.inc("bytes.downloaded", wire)
+                    self.metrics.inc("bytes.decoded", decoded)
+                    s.add(decoded)
 
     def list(
         self, path: str, key: Optional[str] = None, limit: int = 100
@@ -96,11 +344,26 @@ class NotebookAPI(Singleton["NotebookAPI"]):
         self.latest: dict[str, int] = {}
         self.ids: dict[str, str] = {}
         self.resolved: dict[str, NotebookRef] = {}
+        # The most recently parsed notebooks, by the key of their cache entry
+        # (the notebook key, partitioned by API key for private notebooks)
+        self.parsed: LRUCache[Notebook] = LRUCache(PARSED_LIMIT)
+        # The expected hashes of the exports pinned by a lockfile, by
+        # notebook key, and the ones that were verified.
+        self.hashes: dict[str, str] = {}
+        self.verified: set[str] = set()
+        # When locked, only the notebooks pinned by the lockfile resolve
+        self.isLocked: bool = False
+        # The metrics are shared with the underlying API, so that all the
+        # cache layers are reported together.
+        self.metrics: Metrics = self.api.metrics
+        self.flights: SingleFlight = SingleFlight(metrics=self.metrics)
 
     def parseJSHeader(self, source: str) -> NotebookHeader:
         meta = {
             (k[3:].lower().strip().split()[0]): v.strip()
-            for k, v in (l.split(":", 1) for l in source.split("\n")[0:5])
+            for k, v in (
+                l.split(":", 1) for l in source.split("\n")[0:5] if ":" in l
+            )
         }
         # {'url': 'https://observablehq.com/d/XXXXXXXXXXXXXXXX', 'title':
         # '000-Sitemap', 'author': 'Sébastien Pierre (@sebastien)', 'version':
@@ -116,6 +379,7 @@ class NotebookAPI(Singleton["NotebookAPI"]):
             username=meta["author"].rsplit("(@", 1)[1].split(")")[0],
         )
 
+    @timed("notebook.resolve")
     def resolve(
         self, notebook: Union[NotebookRef, str], key: Optional[str] = None
     ) -> NotebookRef:
@@ -124,7 +388,26 @@ class NotebookAPI(Singleton["NotebookAPI"]):
         if isinstance(notebook, NotebookRef):
             return notebook
         elif notebook in self.resolved:
+            self.metrics.hit("resolve")
             return self.resolved[notebook]
+        # Concurrent resolutions of the same notebook share a single request
+        return self.flights.run(
+            notebook,
+            lambda: self.resolved.get(notebook) or self.doResolve(notebook, key),
+        )
+
+    def doResolve(
+        self, notebook: str, key: Optional[str] = None, withBody: bool = False
+    ) -> NotebookRef:
+        """Resolves the given notebook name with the API. Private notebooks
+        are resolved from the header of their export, which is the only part
+        downloaded unless `withBody` is set, in which case the whole export
+        is downloaded once and cached under its versioned URL."""
+        self.metrics.miss("resolve")
+        if self.isLocked:
+            raise RuntimeError(
+                f"Notebook is not pinned by the lockfile: {notebook}, the lockfile needs to be updated"
+            )
         name = Notebook.ParseName(notebook)
         if not name:
             raise ValueError(
@@ -137,9 +420,13 @@ class NotebookAPI(Singleton["NotebookAPI"]):
                 raise RuntimeError(
                     f"Missing Observable API key variable {OBSERVABLE_API_KEY}, visit https://observablehq.com/settings/api-keys to create one"
                 )
-            ref = f"d/{name.id}{rev}"
+            url = f"d/{name.id}{rev}.js"
             # https://api.observablehq.com/d/[NOTEBOOK_ID][@VERSION].[FORMAT]?v=3&api_key=xxxx
-            header = self.parseJSHeader(observable_request(f"{ref}.js", key))
+            header = (
+                self.downloadPrivate(name.id, url, key)
+                if withBody and not self.api.isCached(url, key)
+                else self.parseJSHeader(self.api.header(url, key))
+            )
             assert name.id
             document_id: str = header.id or name.id
             document_latest: int = header.version
@@ -174,8 +461,129 @@ class NotebookAPI(Singleton["NotebookAPI"]):
             name=document_name,
         )
         self.resolved[notebook] = res
+        # The key of the reference is unambiguous, so it resolves to it too
+        self.resolved.setdefault(res.key, res)
+        # Unversioned URLs are aliases of the latest version
+        if name.rev is None:
+            self.alias(
+                res,
+                f"d/{name.id}.js" if name.id else f"@{name.username}/{name.name}.js",
+            )
         return res
 
+    def forget(self, notebook: str, key: Optional[str] = None) -> "NotebookAPI":
+        """Forgets the resolution of the given unversioned notebook name, so
+        that it is resolved again to its latest version."""
+        self.resolved.pop(notebook, None)
+        name = Notebook.ParseName(notebook)
+        if name and name.rev is None:
+            if name.id:
+                self.api.aliases.pop(f"d/{name.id}.js", None)
+            else:
+                self.api.aliases.pop(f"@{name.username}/{name.name}.js", None)
+                self.api.cache.remove(
+                    self.api.cacheKey(f"document/@{name.username}/{name.name}", key)
+                )
+        return self
+
+    def alias(self, ref: NotebookRef, *urls: str) -> str:
+        """Registers the URLs of the given notebook version, and the given
+        URLs, as aliases of its canonical cache entry, keyed by `ref.key`.
+        Returns the URL of its JavaScript export."""
+        versioned = f"d/{ref.id}@{ref.version}.js"
+        url = f"@{ref.username}/{ref.name}@{ref.version}.js" if ref.name else versioned
+        # Named notebooks are public, so their export doesn't depend on the
+        # credential.
+        for _ in (url, versioned, *urls):
+            self.api.alias(_, f"{ref.key}.js", shared=bool(ref.name))
+        return url
+
+    def downloadPrivate(
+        self, id: str, url: str, key: Optional[str] = None
+    ) -> NotebookHeader:
+        """Downloads the export of the private notebook with the given id at
+        the given URL, which may not have a version, and parses its header.
+        The export is cached under its canonical key, which is what `url()`
+        resolves to, so that loading it doesn't need another download."""
+        self.metrics.miss("response")
+        with self.api.response(url, key) as chunks:
+            body = chunks()
+            head: bytes = b""
+            # The header is normally within the first chunk
+            for chunk in body:
+                head += chunk
+                i = head.find(b"\n// Version:")
+                if i >= 0 and b"\n" in head[i + 1 :]:
+                    break
+            header = self.parseJSHeader(
+                readHeader(head.decode("utf8", errors="replace").splitlines(True))
+            )
+            versioned = self.alias(
+                NotebookRef(
+                    id=header.id or id,
+                    version=header.version,
+                    username=header.username,
+                    name=header.name,
+                )
+            )
+            with self.api.cache.writer(self.api.cacheKey(versioned, key)) as write:
+                write(head)
+                for chunk in body:
+                    write(chunk)
+        return header
+
+    def resolveURL(
+        self, notebook: Union[NotebookRef, str], key: Optional[str] = None
+    ) -> str:
+        """Resolves the given notebook and returns the URL of its export,
+        making sure that private notebooks that are not resolved yet are
+        downloaded with a single request."""
+        if isinstance(notebook, str) and notebook not in self.resolved:
+            name = Notebook.ParseName(notebook)
+            if name and Notebook.IsPrivate(name) and not self.isLocked:
+                return self.url(
+                    self.flights.run(
+                        notebook, lambda: self.doResolve(notebook, key, withBody=True)
+                    ),
+                    key,
+                )
+        url = self.url(notebook, key)
+        if self.hashes:
+            self.verify(self.resolve(notebook, key), url, key)
+        return url
+
+    def lock(self, lockfile: Lockfile) -> "NotebookAPI":
+        """Resolves the notebooks with the references pinned by the given
+        lockfile, without querying the API, and verifies their exports
+        against the pinned hashes. Notebooks that are not pinned can't be
+        resolved anymore."""
+        for ref_key, ref in lockfile.refs.items():
+            self.resolved[ref_key] = ref
+            self.alias(ref)
+        for name, ref_key in lockfile.names.items():
+            self.resolved[name] = lockfile.refs[ref_key]
+        self.hashes.update(lockfile.hashes)
+        self.isLocked = True
+        return self
+
+    def verify(self, ref: NotebookRef, url: str, key: Optional[str] = None):
+        """Checks that the export of the given notebook matches the hash
+        pinned by the lockfile, once per process. Exports that don't match
+        are removed from the cache."""
+        expected = self.hashes.get(ref.key)
+        if not expected or ref.key in self.verified:
+            return
+        cache_key = self.api.ensure(url, key or self.api.key())
+        h = hashlib.sha256()
+        for chunk in self.api.cache.chunks(cache_key):
+            h.update(chunk)
+        if (actual := h.hexdigest()) != expected:
+            self.api.cache.remove(cache_key)
+            raise RuntimeError(
+                f"Export of {ref.key} does not match the lockfile: expected sha256 {expected}, got {actual}"
+            )
+        self.verified.add(ref.key)
+
     # FIXME: We should add a resolver. And also the actual resolved ID may
     # be different from the  ID that we requested. The Observable API returns
     # the notebook AND its revision number.
@@ -184,48 +592,163 @@ class NotebookAPI(Singleton["NotebookAPI"]):
     ) -> list[NotebookRef]:
         """Returns the list of all the dependencies, including transitive
         dependencies from this notebook."""
+        return [ref for ref, _ in self.crawl(*notebook, key=key).values()]
+
+    def crawl(
+        self, *notebook: Union[NotebookRef, str], key: Optional[str] = None
+    ) -> dict[str, tuple[NotebookRef, Notebook]]:
+        """Loads the given notebooks and all their (transitive) dependencies,
+        returning their references and parsed notebooks by notebook key, so
+        that the whole graph can be exported without parsing it again."""
         loaded: dict[str, list[NotebookRef]] = {}
+        # NOTE: We keep the references, as resolving their keys again would
+        # require an API key for public notebooks.
+        graph: dict[str, tuple[NotebookRef, Notebook]] = {}
         to_process: list[NotebookRef] = [self.resolve(_, key) for _ in notebook]
         while to_process:
             nref = to_process.pop()
-            if nref.id in loaded:
+            if nref.key in loaded:
                 continue
             n = self.load(nref, key=key)
             if n:
+                graph[nref.key] = (nref, n)
                 loaded[nref.key] = [self.resolve(_, key) for _ in n.imported]
-                to_process += [_ for _ in loaded[nref.key] if _.id not in loaded]
-        return [self.resolve(_, key) for _ in loaded]
+                to_process += [_ for _ in loaded[nref.key] if _.key not in loaded]
+        return {_: graph[_] for _ in loaded}
 
+    def url(
+        self, notebook: Union[NotebookRef, str], key: Optional[str] = None
+    ) -> str:
+        """Returns the API URL of the JavaScript export of the given notebook"""
+        ref = self.resolve(notebook, key)
+        if not ref.name:
+            if not (key or self.api.key()):
+                raise RuntimeError(
+                    f"Missing Observable API key variable {OBSERVABLE_API_KEY}, visit https://observablehq.com/settings/api-keys to create one"
+                )
+        # https://api.observablehq.com/d/[NOTEBOOK_ID][@VERSION].[FORMAT]?v=3&api_key=xxxx
+        return self.alias(ref)
+
+    @timed("notebook.get")
     def get(
         self,
         notebook: Union[NotebookRef, str],
         key: Optional[str] = None,
     ) -> str:
         """Downloads the given notebook, optionally using the given API key"""
-        ref = self.resolve(notebook)
+        return self.api.request(
+            self.resolveURL(notebook, key), key or self.api.key()
+        )
+
+    @timed("notebook.stream")
+    def stream(
+        self,
+        notebook: Union[NotebookRef, str],
+        out: BinaryIO,
+        key: Optional[str] = None,
+    ) -> int:
+        """Writes the raw export of the given notebook to the binary file
+        `out`, without decoding it. Returns the number of bytes written."""
+        return self.api.stream(
+            self.resolveURL(notebook, key), out, key or self.api.key()
+        )
+
+    def chunks(
+        self, notebook: Union[NotebookRef, str], key: Optional[str] = None
+    ) -> Iterator[bytes]:
+        """Yields the raw export of the given notebook, chunk by chunk."""
         api_key = key or self.api.key()
-        if not ref.name:
-            if not api_key:
-                raise RuntimeError(
-                    f"Missing Observable API key variable {OBSERVABLE_API_KEY}, visit https://observablehq.com/settings/api-keys to create one"
-                )
-            # https://api.observablehq.com/d/[NOTEBOOK_ID][@VERSION].[FORMAT]?v=3&api_key=xxxx
-            url = f"d/{ref.id}@{ref.version}.js"
-        else:
-            url = f"@{ref.username}/{ref.name}@{ref.version}.js"
-        return self.api.request(url, api_key)
+        cache_key = self.api.ensure(self.resolveURL(notebook, key), api_key)
+        return self.api.cache.chunks(cache_key)
 
     def load(
-        self, notebook: Union[NotebookRef, str], key: Optional[str] = None
+        self,
+        notebook: Union[NotebookRef, str],
+        key: Optional[str] = None,
+        selector: Optional[Selector] = None,
     ) -> Optional[Notebook]:
-        """Gets and parses the given notebook"""
-        return self.parse(self.get(notebook, key=key))
+        """Gets and parses the given notebook. The cached export is
+        decompressed and fed to the parser as a stream of lines. Parsed
+        notebooks are kept by cache key, along with their derived values
+        (like the cell fingerprints), and concurrent loads of the same
+        notebook share a single parse. Notebooks parsed with a selector
+        only have the selected cells, and are not kept."""
+        api_key = key or self.api.key()
+        url = self.resolveURL(notebook, key)
+        cache_key = self.api.cacheKey(url, api_key)
+        if parsed := self.parsed.get(cache_key):
+            self.metrics.hit("parsed")
+            return selector.select(parsed) if selector else parsed
+        elif selector and not selector.isAll:
+            with span("notebook.parse"):
+                return self.parseLines(self.api.lines(url, api_key), selector)
+        return self.flights.run(
+            f"parse:{cache_key}",
+            lambda: self.parsed.get(cache_key) or self.doLoad(url, cache_key, api_key),
+        )
 
-    def parse(self, content: str) -> Optional[Notebook]:
+    def doLoad(self, url: str, cache_key: str, key: str) -> Optional[Notebook]:
+        self.metrics.miss("parsed")
+        lines = self.api.lines(url, key)
+        with span("notebook.parse"):
+            parsed = self.parseLines(lines)
+        if parsed:
+            self.parsed[cache_key] = parsed
+        return parsed
+
+    def prime(
+        self, ref: NotebookRef, content: str, key: Optional[str] = None
+    ) -> Optional[Notebook]:
+        """Parses the given export of the given notebook version and keeps it
+        as if it was loaded, so that loading it doesn't need the API."""
+        self.resolved.setdefault(ref.key, ref)
+        cache_key = self.api.cacheKey(self.url(ref, key), key or self.api.key())
+        if parsed := self.parse(content):
+            self.parsed[cache_key] = parsed
+        return parsed
+
+    def parse(
+        self, content: str, selector: Optional[Selector] = None
+    ) -> Optional[Notebook]:
         """Parses the given notebook text into a Notebook object"""
-        parser = NotebookParser()
-        for line in content.split("\n"):
-            parser.feed(f"{line}\n")
+        with span("notebook.parse") as s:
+            notebook = self.parseLines(content.split("\n"), selector)
+            s.add(len(content))
+        return notebook
+
+    def parseFile(
+        self, path: str, selector: Optional[Selector] = None
+    ) -> Optional[Notebook]:
+        """Parses the notebook exported at the given path, `-` being stdin.
+        Files are memory-mapped and decoded line by line, so that they
+        are never decoded as a whole."""
+        with span("notebook.parse") as s:
+            if path == "-":
+                return self.parseLines(
+                    (_.decode("utf8") for _ in sys.stdin.buffer), selector
+                )
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                s.add(size)
+                # NOTE: Empty files can't be memory-mapped
+                if not size:
+                    return self.parseLines((), selector)
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    return self.parseLines(
+                        (_.decode("utf8") for _ in iter(m.readline, b"")), selector
+                    )
+
+    def parseLines(
+        self, lines: Iterable[str], selector: Optional[Selector] = None
+    ) -> Optional[Notebook]:
+        """Parses the given lines, with or without their trailing `\\n`,
+        into a Notebook object, keeping only the cells matching the given
+        selector, if any. The bodies of the imported modules are skipped, as
+        only the notebook itself is returned."""
+        parser = NotebookParser(selector, skipsImported=True)
+        for line in lines:
+            parser.feed(line if line.endswith("\n") else f"{line}\n")
+        parser.select()
         return parser.notebook
 
 
@@ -251,6 +774,10 @@ def observable_list(
     return ObservableAPI.Get().list(path, key=key, limit=limit)
 
 
+def observable_metrics() -> Metrics:
+    return ObservableAPI.Get().metrics
+
+
 def user_information(username: str):
     pass
 
@@ -285,24 +812,53 @@ def notebook_get(
     return NotebookAPI.Get().get(notebook, key)
 
 
-def notebook_parse(content: str) -> Optional[Notebook]:
-    return NotebookAPI.Get().parse(content)
+def notebook_stream(notebook: str, out: BinaryIO, key: Optional[str] = None) -> int:
+    return NotebookAPI.Get().stream(notebook, out, key)
+
+
+def notebook_parse(
+    content: str, selector: Optional[Selector] = None
+) -> Optional[Notebook]:
+    return NotebookAPI.Get().parse(content, selector)
+
 
+def notebook_parse_file(
+    path: str, selector: Optional[Selector] = None
+) -> Optional[Notebook]:
+    return NotebookAPI.Get().parseFile(path, selector)
 
-def notebook_load(notebook: str, key: Optional[str] = None) -> Optional[Notebook]:
-    return NotebookAPI.Get().load(notebook, key)
+
+def notebook_load(
+    notebook: str, key: Optional[str] = None, selector: Optional[Selector] = None
+) -> Optional[Notebook]:
+    return NotebookAPI.Get().load(notebook, key, selector)
 
 
 def notebook_dependencies(*notebook: str, key: Optional[str] = None) -> list[str]:
-    return NotebookAPI.Get().dependencies(*notebook, key=key)
+    return [_.key for _ in NotebookAPI.Get().dependencies(*notebook, key=key)]
+
+
+def notebook_diff(
+    before: str, after: str, key: Optional[str] = None
+) -> list[Change]:
+    """Returns the cell-level changes between the two given notebooks,
+    typically two versions like `@user/notebook@2228` and `@user/notebook`."""
+    api = NotebookAPI.Get()
+    a = api.load(before, key)
+    b = api.load(after, key)
+    if not (a and b):
+        raise RuntimeError(f"Could not load notebook: {before if not a else after}")
+    return diff(a, b)
 
 
+@timed("export.json")
 def notebook_json(notebook: Notebook) -> str:
     return json.dumps(
         {_.name: _.asDict() for _ in notebook.cells},
     )
 
 
+@timed("export.md")
 def notebook_md(notebook: Notebook) -> Iterator[str]:
     """Converts the Observable notebook as a Markdown document."""
     for cell in notebook.cells:
@@ -318,6 +874,7 @@ def notebook_md(notebook: Notebook) -> Iterator[str]:
             yield "```\n\n"
 
 
+@timed("export.js")
 def notebook_js(
     notebook: Notebook,
     transitiveExports=False,
@@ -380,12 +937,8 @@ def notebook_js(
     # mutable ones.
     for cell in notebook.defined:
         # We filter out ObservableHQ specific viewof and initial (mutable)
-        # variables. We should probably tag the cells.
-        if cell.name.startswith("viewof_"):
-            continue
-        elif cell.name.startswith("initial_"):
-            continue
-        elif cell.name.startswith("mutable_"):
+        # variables.
+        if cell.isSpecial:
             continue
         elif (not cell.isPreprocessed or withPreprocessed) and (
             not cell.isAnonymous or withAnonymous
@@ -400,4 +953,150 @@ def notebook_js(
     yield "// EOF\n"
 
 
+@timed("export.bundle")
+def notebook_bundle(
+    notebook: Notebook,
+    transitiveExports=False,
+    withPreprocessed=True,
+    withAnonymous=True,
+    versions: Optional[list[NotebookRef]] = None,
+    key: Optional[str] = None,
+) -> Iterator[str]:
+    """Converts the Observable notebook as a single JavaScript module that
+    includes its dependencies. Dependencies are followed transitively through
+    the cell inputs, so that only the cells reachable from the exported
+    cells are included. Each dependency is scoped in its own closure, so that
+    cells with the same name in different notebooks don't clash."""
+    imported_version: dict[str, int] = {
+        _.id: _.version for _ in versions or () if _.version
+    }
+
+    refs: dict[str, NotebookRef] = {}
+    loaded: dict[str, Notebook] = {}
+    # The names needed from each notebook
+    needed: dict[str, set[str]] = {}
+    # The imports of each notebook, as `{ref.key: {remote: local}}`
+    requires: dict[str, dict[str, dict[str, str]]] = {}
+
+    def resolve(source: str) -> NotebookRef:
+        ref = notebook_resolve(source, key)
+        version = imported_version.get(ref.id, ref.version)
+        return (
+            ref
+            if version == ref.version
+            else NotebookRef(
+                id=ref.id, version=version, username=ref.username, name=ref.name
+            )
+        )
+
+    def scope(ref: NotebookRef) -> str:
+        return f"__{ref.id}_{ref.version}"
+
+    def imports(cells: list[Cell]) -> dict[str, dict[str, str]]:
+        """Groups the given imported cells as `{ref.key: {remote: local}}`"""
+        res: dict[str, dict[str, str]] = {}
+        for cell in cells:
+            ref = resolve(cell.source)
+            refs[ref.key] = ref
+            res.setdefault(ref.key, {})[cell.sourceName or cell.name] = cell.name
+        return res
+
+    # --
+    # We start with the cells exported by the notebook, and then crawl the
+    # dependencies, accumulating the names needed from each of them until
+    # we reach a fixed point.
+    exported: list[Cell] = [
+        _
+        for _ in notebook.defined
+        if not _.isSpecial
+        and (not _.isPreprocessed or withPreprocessed)
+        and (not _.isAnonymous or withAnonymous)
+    ]
+    root_cells = notebook.closure([_.name for _ in exported] + list(notebook.entries))
+    root_imports = imports([_ for _ in root_cells if _.source != notebook.id])
+    pending: list[tuple[str, set[str]]] = [
+        (k, set(v)) for k, v in root_imports.items()
+    ]
+    while pending:
+        ref_key, names = pending.pop()
+        added = names - needed.get(ref_key, set())
+        if not added:
+            continue
+        needed.setdefault(ref_key, set()).update(added)
+        if ref_key not in loaded:
+            dependency = NotebookAPI.Get().load(refs[ref_key], key=key)
+            assert dependency, f"Could not load notebook: {ref_key}"
+            loaded[ref_key] = dependency
+        dependency = loaded[ref_key]
+        requires[ref_key] = imports(
+            [
+                _
+                for _ in dependency.closure(needed[ref_key])
+                if _.source != dependency.id
+            ]
+        )
+        pending += [(k, set(v)) for k, v in requires[ref_key].items()]
+
+    # --
+    # Dependencies are output before their dependents
+    ordered: list[str] = []
+
+    def walk(ref_key: str, visiting: set[str]):
+        if ref_key in ordered or ref_key in visiting:
+            return
+        visiting.add(ref_key)
+        for _ in requires.get(ref_key, {}):
+            walk(_, visiting)
+        ordered.append(ref_key)
+
+    for ref_key in root_imports:
+        walk(ref_key, set())
+
+    def body(cell: Cell) -> str:
+        return (
+            json.dumps({"type": cell.type, "value": cell.text})
+            if cell.isPreprocessed
+            else "".join(cell.value)
+        )
+
+    def destructure(imported: dict[str, dict[str, str]]) -> Iterator[str]:
+        for ref_key, names in imported.items():
+            yield "const {" + ", ".join(
+                remote if remote == local else f"{remote}: {local}"
+                for remote, local in names.items()
+            ) + "} = " + scope(refs[ref_key]) + ";\n"
+
+    for ref_key in ordered:
+        ref = refs[ref_key]
+        dependency = loaded[ref_key]
+        yield f"\n// @notebook('{ref_key}')\nconst {scope(ref)} = (() => {{\n"
+        yield from destructure(requires.get(ref_key, {}))
+        available: set[str] = {
+            local for _ in requires.get(ref_key, {}).values() for local in _.values()
+        }
+        for cell in dependency.closure(needed[ref_key]):
+            if cell.source == dependency.id and not cell.isEmpty:
+                available.add(cell.name)
+                yield f"\n// @cell('{cell.name}', {cell.inputs})\nconst {cell.name} = (\n"
+                yield body(cell)
+                yield ");\n"
+        for name in sorted(needed[ref_key] - available):
+            yield f"// NOTE: Cell '{name}' is not defined in {ref_key}\n"
+        yield "return {" + ", ".join(sorted(needed[ref_key] & available)) + "};\n"
+        yield "})();\n"
+
+    yield "\n"
+    yield from destructure(root_imports)
+    if transitiveExports:
+        yield "export {" + ", ".join(
+            local for _ in root_imports.values() for local in _.values()
+        ) + "};\n"
+    for cell in exported:
+        yield f"\n// @cell('{cell.name}', {cell.inputs})\nexport const {cell.name} = (\n"
+        yield body(cell)
+        yield ");\n"
+
+    yield "// EOF\n"
+
+
 # EOF
@@ -0,0 +1,400 @@
+from .model import Notebook, NotebookRef
+from .selector import Selector
+from .parser import imports
+from .output import write_if_changed, AtomicOutput, copy
+from .scheduler import SingleFlight
+from .cache import LRUCache
+from typing import Optional, Iterator, Iterable, Union, NamedTuple, Any
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+    ProcessPoolExecutor,
+    as_completed,
+)
+from dataclasses import dataclass
+from pathlib import Path
+import hashlib
+import multiprocessing
+import os
+
+__doc__ = """
+Bulk exports of many notebooks. Notebooks are fetched on I/O threads, while
+parsing and rendering is fanned out to a process pool, as it is pure-Python
+CPU work. Only the notebook source, the rendered output and the resolved
+references cross process boundaries, along with the exports of the
+dependencies of bundles, as the workers never use the API. Raw exports are
+streamed straight to their files. Embedding code can use the batch API
+instead, which renders on a pool of threads sharing the fetch, parse and
+render caches. Whole dependency graphs are exported from the notebooks
+parsed while crawling the graph, so that each of them is parsed once.
+"""
+
+# The file extension for each of the output formats
+EXTENSIONS: dict[str, str] = dict(js="js", bundle="js", md="md", json="json", raw="js")
+# The number of rendered exports kept warm by a renderer
+RENDERED_LIMIT = 256
+
+
+@dataclass
+class Exported:
+    """The result of exporting one notebook in a bulk export."""
+
+    notebook: str
+    ref: Optional[NotebookRef] = None
+    path: Optional[str] = None
+    error: Optional[str] = None
+    # Tells if the file was written, or skipped as it was unchanged
+    written: bool = False
+
+
+class Fetched(NamedTuple):
+    """A notebook fetched for a bulk export, with the references of the
+    notebooks it imports and, for bundles, the exports of its dependencies.
+    The source is the path of local files, which the workers read."""
+
+    ref: Optional[NotebookRef]
+    source: Union[str, Path]
+    resolved: dict[str, NotebookRef]
+    dependencies: list[tuple[NotebookRef, str]]
+
+
+def render_notebook(
+    notebook: Notebook, format: str, key: Optional[str] = None, **options
+) -> str:
+    """Renders the given parsed notebook in the given format (anything but
+    `raw`)."""
+    from .api import notebook_js, notebook_bundle, notebook_md, notebook_json
+
+    if format == "json":
+        return notebook_json(notebook)
+    elif format == "md":
+        return "".join(notebook_md(notebook))
+    elif format == "bundle":
+        return "".join(notebook_bundle(notebook, key=key, **options))
+    elif format == "js":
+        return "".join(notebook_js(notebook, **options))
+    else:
+        raise ValueError(f"Unsupported export format: {format}")
+
+
+def render(
+    source: Union[str, Path],
+    format: str,
+    options: dict[str, Any],
+    resolved: dict[str, NotebookRef],
+    key: Optional[str] = None,
+    selector: Optional[Selector] = None,
+    entries: Iterable[str] = (),
+    dependencies: Iterable[tuple[NotebookRef, str]] = (),
+) -> tuple[str, dict[str, NotebookRef]]:
+    """Parses and renders the given notebook source in the given format. This
+    is run in a worker process, primed with the references `resolved` by the
+    parent process and with the exports of the `dependencies` of bundles, so
+    that it doesn't need the API. When `source` is a path, the worker reads
+    the file itself. Only the cells matching the `selector` are parsed, and
+    when `entries` are given, only them and the cells they depend on are
+    rendered. Returns the rendered output and the references that were
+    newly resolved by the worker."""
+    from .api import NotebookAPI
+
+    api = NotebookAPI.Get()
+    api.resolved.update(resolved)
+    for ref, text in dependencies:
+        api.prime(ref, text, key)
+    notebook = (
+        api.parseFile(str(source), selector)
+        if isinstance(source, Path)
+        else api.parse(source, selector)
+    )
+    assert notebook, "Could not parse notebook"
+    if entries := list(entries):
+        for entry in entries:
+            if entry not in notebook.index:
+                raise RuntimeError(f"Cell not found in {notebook.id}: {entry}")
+        notebook = notebook.entry(entries)
+    output = render_notebook(notebook, format, key=key, **options)
+    return output, {k: v for k, v in api.resolved.items() if k not in resolved}
+
+
+def context() -> Any:
+    """Returns the multiprocessing context used to start the workers. They
+    are not forked, as forking a process while the fetcher threads are
+    running could deadlock on the locks held by these threads."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn"
+    )
+
+
+def export_bulk(
+    notebooks: Iterable[str],
+    output: str,
+    format: str = "js",
+    key: Optional[str] = None,
+    jobs: Optional[int] = None,
+    fetchers: int = 8,
+    selector: Optional[Selector] = None,
+    entries: Iterable[str] = (),
+    **options,
+) -> Iterator[Exported]:
+    """Exports the given notebooks to `<output>/<id>@<version>.<ext>` files,
+    yielding the results as they complete. A failure to export a notebook is
+    reported in its result and doesn't stop the others. Notebooks that are
+    local files are exported to `<output>/<name>.<ext>`, their name being
+    the file name without its extension. The `selector` and `entries`
+    select the exported cells, as in `render`."""
+    from .api import NotebookAPI
+
+    api = NotebookAPI.Get()
+    ext = EXTENSIONS.get(format, format)
+    os.makedirs(output, exist_ok=True)
+
+    def fetch(notebook: str) -> Fetched:
+        """Fetches the given notebook, unless it's a local file, and resolves
+        the notebooks it imports, fetching them too for bundles, as the
+        workers don't use the API."""
+        if os.path.isfile(notebook):
+            ref, source = None, Path(notebook)
+        else:
+            ref = api.resolve(notebook, key)
+            source = api.get(ref, key)
+        names: list[str] = []
+        if format in ("js", "bundle") and isinstance(source, Path):
+            with open(source, encoding="utf8") as f:
+                names = imports(f)
+        elif format in ("js", "bundle"):
+            names = imports(source.split("\n"))
+        resolved: dict[str, NotebookRef] = {}
+        dependencies: dict[str, tuple[NotebookRef, str]] = {}
+        while names:
+            name = names.pop()
+            if name in resolved:
+                continue
+            dependency = resolved[name] = api.resolve(name, key)
+            # Bundles include the whole dependency graph
+            if format == "bundle" and dependency.key not in dependencies:
+                text = api.get(dependency, key)
+                dependencies[dependency.key] = (dependency, text)
+                names += imports(text.split("\n"))
+        return Fetched(ref, source, resolved, list(dependencies.values()))
+
+    def path(notebook: str, ref: Optional[NotebookRef]) -> str:
+        return os.path.join(
+            output, f"{ref.key if ref else Path(notebook).stem}.{ext}"
+        )
+
+    def write(notebook: str, ref: Optional[NotebookRef], text: str) -> Exported:
+        at = path(notebook, ref)
+        return Exported(notebook, ref, at, written=write_if_changed(at, text))
+
+    def stream(notebook: str) -> Exported:
+        ref = None if os.path.isfile(notebook) else api.resolve(notebook, key)
+        out = AtomicOutput(path(notebook, ref))
+        with out as f:
+            if ref:
+                api.stream(ref, f, key)
+            else:
+                copy(notebook, f)
+        return Exported(notebook, ref, out.path, written=out.written)
+
+    entries = list(entries)
+
+    def submit(fetched: Fetched) -> Future:
+        return processes.submit(
+            render,
+            fetched.source,
+            format,
+            options,
+            fetched.resolved,
+            key,
+            selector,
+            entries,
+            fetched.dependencies,
+        )
+
+    # NOTE: The process pool is created before the fetcher threads are
+    # started, and its workers are not forked anyway (see `context`).
+    with ProcessPoolExecutor(
+        max_workers=jobs, mp_context=context()
+    ) as processes, ThreadPoolExecutor(max_workers=fetchers) as threads:
+        fetching: dict[Future, str] = {}
+        rendering: dict[Future, tuple[str, Optional[NotebookRef]]] = {}
+        for notebook in notebooks:
+            fetching[
+                threads.submit(stream if format == "raw" else fetch, notebook)
+            ] = notebook
+        for future in as_completed(fetching):
+            notebook = fetching[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                yield Exported(notebook, error=str(e))
+                continue
+            if format == "raw":
+                yield result
+            else:
+                rendering[submit(result)] = (notebook, result.ref)
+        for future in as_completed(rendering):
+            notebook, ref = rendering[future]
+            try:
+                text, resolved = future.result()
+            except Exception as e:
+                yield Exported(notebook, ref, error=str(e))
+                continue
+            api.resolved.update(resolved)
+            yield write(notebook, ref, text)
+
+
+def export_graph(
+    notebooks: Iterable[Union[NotebookRef, str]],
+    output: str,
+    format: str = "js",
+    key: Optional[str] = None,
+    **options,
+) -> Iterator[Exported]:
+    """Exports the given notebooks and all their (transitive) dependencies
+    to `<output>/<id>@<version>.<ext>` files, yielding the results as they
+    are written. The notebooks parsed while crawling the dependency graph
+    are rendered as they are, so that each notebook is fetched and parsed
+    once."""
+    from .api import NotebookAPI
+
+    api = NotebookAPI.Get()
+    ext = EXTENSIONS.get(format, format)
+    notebooks = list(notebooks)
+    try:
+        graph = api.crawl(*notebooks, key=key)
+    except Exception as e:
+        for notebook in notebooks:
+            yield Exported(str(notebook), error=str(e))
+        return
+    os.makedirs(output, exist_ok=True)
+    for ref, notebook in graph.values():
+        at = os.path.join(output, f"{ref.key}.{ext}")
+        try:
+            if format == "raw":
+                out = AtomicOutput(at)
+                with out as f:
+                    api.stream(ref, f, key)
+                written = out.written
+            else:
+                written = write_if_changed(
+                    at, render_notebook(notebook, format, key=key, **options)
+                )
+        except Exception as e:
+            yield Exported(ref.key, ref, at, error=str(e))
+            continue
+        yield Exported(ref.key, ref, at, written=written)
+
+
+class Rendered(NamedTuple):
+    """A rendered export, encoded as UTF-8, with its SHA-1 digest."""
+
+    body: bytes
+    digest: str
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf8")
+
+
+class Renderer:
+    """Renders the exports of notebooks with the given options, keeping the
+    `limit` most recently used exports by notebook version and format.
+    Concurrent renders of the same export are coalesced, and the notebooks
+    are loaded (and parsed once) through `NotebookAPI`."""
+
+    def __init__(
+        self, key: Optional[str] = None, limit: int = RENDERED_LIMIT, **options
+    ):
+        from .api import NotebookAPI
+
+        self.api = NotebookAPI.Get()
+        self.key: Optional[str] = key
+        self.options: dict[str, Any] = options
+        self.rendered: LRUCache[Rendered] = LRUCache(limit)
+        self.flights: SingleFlight = SingleFlight(metrics=self.api.metrics)
+
+    def render(self, notebook: Union[NotebookRef, str], format: str) -> Rendered:
+        ref = self.api.resolve(notebook, self.key)
+        key = f"{ref.key}.{format}"
+        if rendered := self.rendered.get(key):
+            self.api.metrics.hit("render")
+            return rendered
+        return self.flights.run(
+            key, lambda: self.rendered.get(key) or self.doRender(ref, format)
+        )
+
+    def doRender(self, ref: NotebookRef, format: str) -> Rendered:
+        self.api.metrics.miss("render")
+        if format == "raw":
+            body = b"".join(self.api.chunks(ref, self.key))
+        else:
+            notebook = self.api.load(ref, self.key)
+            if not notebook:
+                raise RuntimeError(f"Could not load notebook: {ref.key}")
+            body = render_notebook(
+                notebook, format, key=self.key, **self.options
+            ).encode("utf8")
+        rendered = Rendered(body, hashlib.sha1(body).hexdigest())
+        self.rendered[f"{ref.key}.{format}"] = rendered
+        return rendered
+
+
+@dataclass
+class Export:
+    """The result of exporting a notebook in a given format with
+    `export_many`, the error being set when it failed."""
+
+    notebook: Union[NotebookRef, str]
+    format: str
+    ref: Optional[NotebookRef] = None
+    rendered: Optional[Rendered] = None
+    error: Optional[Exception] = None
+
+    @property
+    def text(self) -> Optional[str]:
+        return self.rendered.text if self.rendered else None
+
+
+def export_many(
+    notebooks: Iterable[Union[NotebookRef, str]],
+    formats: Iterable[str] = ("js",),
+    key: Optional[str] = None,
+    max_workers: int = 8,
+    renderer: Optional[Renderer] = None,
+    **options,
+) -> list["Future[Export]"]:
+    """Exports each of the given notebooks in each of the given formats on
+    a pool of threads, returning one future per notebook and format, in
+    order. The futures resolve to `Export` results: failures are reported
+    in their `error` instead of being raised, so that they don't cancel the
+    rest of the batch. Fetches, parsed notebooks and rendered exports are
+    shared across the batch (and with other batches using the same
+    `renderer`), so that a notebook is fetched and parsed once whatever the
+    number of formats. Use `concurrent.futures.as_completed` to process the
+    results as they complete."""
+    renderer = renderer or Renderer(key, **options)
+    formats = list(formats)
+
+    def export(notebook: Union[NotebookRef, str], format: str) -> Export:
+        result = Export(notebook, format)
+        try:
+            result.ref = renderer.api.resolve(notebook, renderer.key)
+            result.rendered = renderer.render(result.ref, format)
+        except Exception as e:
+            result.error = e
+        return result
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = [
+        executor.submit(export, notebook, format)
+        for notebook in notebooks
+        for format in formats
+    ]
+    # The pending exports still run, the threads exiting once done
+    executor.shutdown(wait=False)
+    return futures
+
+
+# EOF
@@ -0,0 +1,398 @@
+from .output import permissions
+from typing import (
+    Optional,
+    Iterator,
+    Iterable,
+    ContextManager,
+    Callable,
+    Generic,
+    TypeVar,
+    Any,
+)
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+import codecs
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+__doc__ = """
+Caches for the responses of the Observable API. Notebook exports are highly
+compressible text, so entries are stored compressed (zlib) and can be
+decompressed as a stream of lines straight into the parser. The memory
+cache is private to a process, while the directory cache can be shared
+by concurrent processes, and persists across runs: its entries can expire,
+except the immutable ones (like the exports of a given notebook version).
+"""
+
+# The size of the chunks used when streaming entries
+CHUNK_SIZE = 64 * 1024
+
+T = TypeVar("T")
+
+
+def iterlines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Decodes the given UTF-8 chunks as a stream of lines, each line keeping
+    its trailing `\\n` (except maybe the last one)."""
+    decoder = codecs.getincrementaldecoder("utf8")()
+    rest: str = ""
+    for chunk in chunks:
+        text = rest + decoder.decode(chunk)
+        lines = text.split("\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    rest += decoder.decode(b"", final=True)
+    if rest:
+        yield rest
+
+
+class Cache(ABC):
+    """The interface of the response caches."""
+
+    @abstractmethod
+    def __contains__(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, text: str) -> "Cache":
+        ...
+
+    @abstractmethod
+    def chunks(self, key: str) -> Iterator[bytes]:
+        """Yields the decompressed content of the given entry, chunk by
+        chunk, without decompressing it as a whole."""
+
+    def lines(self, key: str) -> Iterator[str]:
+        """Yields the lines of the given entry, decompressed as a stream."""
+        return iterlines(self.chunks(key))
+
+    @contextmanager
+    def writer(self, key: str) -> Iterator[Callable[[bytes], Any]]:
+        """Yields a function that writes the UTF-8 content of the given entry
+        chunk by chunk. The entry is stored when the context exits without
+        error."""
+        chunks: list[bytes] = []
+        yield chunks.append
+        self.set(key, b"".join(chunks).decode("utf8"))
+
+    def file(self, key: str) -> Optional[str]:
+        """Returns the path of a file holding the given entry uncompressed,
+        if any, so that it can be copied without going through Python."""
+        return None
+
+    def lock(self, key: str) -> ContextManager:
+        """Returns a context manager that excludes other processes from
+        filling the given entry at the same time."""
+        return nullcontext()
+
+    @abstractmethod
+    def remove(self, key: str) -> "Cache":
+        ...
+
+    @abstractmethod
+    def clear(self) -> "Cache":
+        ...
+
+
+class MemoryCache(Cache):
+    """An in-memory cache of text entries, compressed with the given zlib
+    level (`0` stores the entries uncompressed)."""
+
+    def __init__(self, level: int = 6):
+        self.level: int = level
+        self.entries: dict[str, tuple[bool, bytes]] = {}
+        self.mutex = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def size(self) -> int:
+        """The number of bytes stored in the cache"""
+        return sum(len(data) for _, data in self.entries.values())
+
+    def encode(self, text: str) -> tuple[bool, bytes]:
+        data = text.encode("utf8")
+        return (True, zlib.compress(data, self.level)) if self.level else (False, data)
+
+    def set(self, key: str, text: str) -> "MemoryCache":
+        entry = self.encode(text)
+        with self.mutex:
+            self.entries[key] = entry
+        return self
+
+    @contextmanager
+    def writer(self, key: str) -> Iterator[Callable[[bytes], Any]]:
+        # Chunks are compressed as they come, so that we never hold the
+        # uncompressed entry as a whole.
+        compressor = zlib.compressobj(self.level) if self.level else None
+        chunks: list[bytes] = []
+
+        def write(chunk: bytes):
+            if data := compressor.compress(chunk) if compressor else chunk:
+                chunks.append(data)
+
+        yield write
+        if compressor:
+            chunks.append(compressor.flush())
+        with self.mutex:
+            self.entries[key] = (bool(compressor), b"".join(chunks))
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        compressed, data = entry
+        return (zlib.decompress(data) if compressed else data).decode("utf8")
+
+    def chunks(self, key: str) -> Iterator[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        compressed, data = entry
+        if not compressed:
+            for i in range(0, len(data), CHUNK_SIZE):
+                yield data[i : i + CHUNK_SIZE]
+        else:
+            decompressor = zlib.decompressobj()
+            for i in range(0, len(data), CHUNK_SIZE):
+                if chunk := decompressor.decompress(data[i : i + CHUNK_SIZE]):
+                    yield chunk
+            if chunk := decompressor.flush():
+                yield chunk
+
+    def remove(self, key: str) -> "MemoryCache":
+        with self.mutex:
+            self.entries.pop(key, None)
+        return self
+
+    def clear(self) -> "MemoryCache":
+        with self.mutex:
+            self.entries = {}
+        return self
+
+
+class DirectoryCache(Cache):
+    """A cache of text entries stored as files in a directory, which can be
+    shared by concurrent processes. Entries are written atomically, gzipped
+    unless the level is `0`, and `lock` uses file locks so that concurrent
+    misses for the same key are fetched only once across processes. When a
+    `ttl` is given, the entries older than `ttl` seconds are expired, unless
+    `isImmutable` tells that their key never changes."""
+
+    def __init__(
+        self,
+        path: str,
+        level: int = 6,
+        ttl: Optional[float] = None,
+        isImmutable: Optional[Callable[[str], bool]] = None,
+    ):
+        self.path: str = path
+        self.level: int = level
+        self.ttl: Optional[float] = ttl
+        self.isImmutable: Optional[Callable[[str], bool]] = isImmutable
+        os.makedirs(path, exist_ok=True)
+
+    def location(self, key: str, compressed: Optional[bool] = None) -> str:
+        """Returns the path of the file storing the given entry"""
+        digest = hashlib.sha1(key.encode("utf8")).hexdigest()
+        is_compressed = bool(self.level) if compressed is None else compressed
+        return os.path.join(
+            self.path, digest[:2], digest + (".gz" if is_compressed else ".txt")
+        )
+
+    def find(self, key: str) -> Optional[tuple[bool, str]]:
+        """Returns the compression and path of the file storing the given
+        entry, if any and not expired. Entries stored with a different level
+        are found too."""
+        expires: bool = self.ttl is not None and not (
+            self.isImmutable and self.isImmutable(key)
+        )
+        for compressed in (bool(self.level), not self.level):
+            path = self.location(key, compressed)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            if expires and time.time() - mtime > (self.ttl or 0.0):
+                return None
+            return compressed, path
+        return None
+
+    def __contains__(self, key: str) -> bool:
+        return self.find(key) is not None
+
+    def __len__(self) -> int:
+        return sum(
+            len([_ for _ in files if not _.endswith((".lock", ".tmp"))])
+            for _, _, files in os.walk(self.path)
+        )
+
+    @property
+    def size(self) -> int:
+        """The number of bytes stored in the cache"""
+        return sum(
+            os.path.getsize(os.path.join(base, _))
+            for base, _, files in os.walk(self.path)
+            for _ in files
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        found = self.find(key)
+        if not found:
+            return None
+        compressed, path = found
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return (zlib.decompress(data, 31) if compressed else data).decode("utf8")
+
+    def set(self, key: str, text: str) -> "DirectoryCache":
+        with self.writer(key) as write:
+            write(text.encode("utf8"))
+        return self
+
+    @contextmanager
+    def writer(self, key: str) -> Iterator[Callable[[bytes], Any]]:
+        compressor = (
+            zlib.compressobj(self.level, zlib.DEFLATED, 31) if self.level else None
+        )
+        path = self.location(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # We write to a temporary file that atomically replaces the entry, so
+        # that other processes never read a partial entry.
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+
+                def write(chunk: bytes):
+                    f.write(compressor.compress(chunk) if compressor else chunk)
+
+                yield write
+                if compressor:
+                    f.write(compressor.flush())
+            os.chmod(temp, permissions(path))
+            os.replace(temp, path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.unlink(temp)
+            raise
+
+    def file(self, key: str) -> Optional[str]:
+        found = self.find(key)
+        return found[1] if found and not found[0] else None
+
+    def chunks(self, key: str) -> Iterator[bytes]:
+        found = self.find(key)
+        if not found:
+            return
+        compressed, path = found
+        decompressor = zlib.decompressobj(31) if compressed else None
+        with open(path, "rb") as f:
+            while data := f.read(CHUNK_SIZE):
+                if not decompressor:
+                    yield data
+                elif chunk := decompressor.decompress(data):
+                    yield chunk
+        if decompressor and (chunk := decompressor.flush()):
+            yield chunk
+
+    @contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        if not fcntl:
+            yield None
+            return
+        path = self.location(key, False)[: -len(".txt")] + ".lock"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield None
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def remove(self, key: str) -> "DirectoryCache":
+        for compressed in (True, False):
+            try:
+                os.unlink(self.location(key, compressed))
+            except FileNotFoundError:
+                pass
+        return self
+
+    def clear(self) -> "DirectoryCache":
+        for base, _, files in os.walk(self.path):
+            for name in files:
+                if not name.endswith(".lock"):
+                    os.unlink(os.path.join(base, name))
+        return self
+
+
+class LRUCache(Generic[T]):
+    """A bounded in-memory cache of objects (like parsed notebooks), which
+    evicts the least recently used entries once it holds more than `limit`
+    entries."""
+
+    def __init__(self, limit: int = 128):
+        self.limit: int = limit
+        self.entries: OrderedDict[str, T] = OrderedDict()
+        self.mutex = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, key: str) -> T:
+        if (value := self.get(key)) is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: T):
+        self.set(key, value)
+
+    def get(self, key: str) -> Optional[T]:
+        with self.mutex:
+            if (value := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: T) -> "LRUCache[T]":
+        with self.mutex:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.limit:
+                self.entries.popitem(last=False)
+        return self
+
+    def remove(self, key: str) -> "LRUCache[T]":
+        with self.mutex:
+            self.entries.pop(key, None)
+        return self
+
+    def clear(self) -> "LRUCache[T]":
+        with self.mutex:
+            self.entries.clear()
+        return self
+
+
+# EOF
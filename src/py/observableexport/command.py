@@ -1,46 +1,78 @@
 from .model import Notebook
-from typing import Union
-from .api import (
-    notebook_get,
-    notebook_parse,
-    notebook_md,
-    notebook_js,
-    notebook_json,
-    notebook_parse,
-    notebook_dependencies,
-)
+from .selector import Selector
+from .profiling import PROFILER
 import sys
+import os
 import argparse
 import json
-from fnmatch import fnmatch
+import io
+from typing import Optional, BinaryIO
 
 
-def matches(name: str, excludes: list[str]) -> bool:
-    """Returns `False` if the `name` matches any of the `excludes` glob pattern"""
-    for f in excludes:
-        if f == name or fnmatch(name, f):
-            return False
-    return True
+def isLocal(name: str) -> bool:
+    """Tells if the given notebook name is a local file, `-` being stdin."""
+    return name == "-" or os.path.isfile(name)
+
+
+def load(name: str, key: Optional[str] = None) -> Notebook:
+    """Loads the given notebook, from a local file or from the API."""
+    from .api import notebook_load, notebook_parse_file
+
+    notebook = notebook_parse_file(name) if isLocal(name) else notebook_load(name, key)
+    if not notebook:
+        raise RuntimeError(f"Could not load notebook: {name}")
+    return notebook
 
 
 def run(args=sys.argv[1:]):
+    # Sub-commands are given as the first argument, otherwise we default
+    # to exporting notebooks.
+    if args and args[0] in COMMANDS:
+        return COMMANDS[args[0]](args[1:])
     parser = argparse.ArgumentParser(
         description="Extracts JavaScript modules from ObservableHQ notebooks."
     )
     parser.add_argument(
         "notebook",
-        help="The name or ID of the notebook, for instance @sebastien/boilerplate or ",
+        help="The name or ID of the notebook, for instance @sebastien/boilerplate or 623731e9e1fcb1ac, or a local raw export ('-' for stdin)",
         nargs="+",
     )
     parser.add_argument(
         "-i",
         "--ignore",
         action="append",
-        help="Excludes the given cell names",
+        help="Excludes the cells matching the given name or glob pattern",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        help="Only includes the cells matching the given name or glob pattern",
+    )
+    parser.add_argument(
+        "--cell-type",
+        action="append",
+        choices=("js", "md", "html"),
+        help="Only includes the cells of the given type",
+    )
+    parser.add_argument(
+        "--source",
+        action="append",
+        help="Only includes the cells defined in (or imported from) the notebooks matching the given glob pattern",
+    )
+    parser.add_argument(
+        "--entry",
+        action="append",
+        help="Only includes the given cells (comma-separated) and the cells they depend on",
     )
     parser.add_argument("-o", "--output", help="Outputs to the given file", default="")
 
     parser.add_argument("-k", "--api-key", help="Sets the API key to use")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of processes used to parse and render when exporting to a directory",
+    )
     parser.add_argument(
         "-a",
         "--all",
@@ -59,10 +91,15 @@ def run(args=sys.argv[1:]):
         action="store_true",
         help="Outputs the notebook dependencies  for the given set of notebook",
     )
+    parser.add_argument(
+        "--with-dependencies",
+        action="store_true",
+        help="Also exports the (transitive) dependencies of the notebooks, to the directory given as output (-o dir/)",
+    )
     parser.add_argument(
         "-t",
         "--type",
-        help="Supports the output type: 'js', 'json' or 'raw'",
+        help="Supports the output type: 'js', 'bundle', 'md', 'json' or 'raw'",
     )
     parser.add_argument(
         "-e",
@@ -71,36 +108,148 @@ def run(args=sys.argv[1:]):
         help="Notebooks re-export their imported symbols (js only)",
         default=False,
     )
+    parser.add_argument(
+        "--profile",
+        help="Writes a JSON report of the time spent in each phase to the given file",
+    )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--cache",
+        help="Caches the API responses in the given directory, which can be shared by concurrent processes (defaults to $OBSERVABLE_CACHE)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="Maximum number of requests per second sent to the API",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Maximum number of concurrent requests sent to the API",
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Writes the network and cache metrics as JSON to the given file, '-' for stderr",
+    )
+    parser.add_argument(
+        "--lock",
+        help="Uses the notebook versions pinned by the given lockfile, verifying their hashes (see the 'lock' command)",
+    )
+
+    args = parser.parse_args(args)
+    if args.profile:
+        PROFILER.enable()
+    try:
+        return export(args)
+    finally:
+        if args.profile:
+            PROFILER.dump(args.profile)
+        if args.metrics:
+            from .api import observable_metrics
+
+            observable_metrics().dump(args.metrics)
+
+
+def export(args: argparse.Namespace) -> int:
+    """Runs the export defined by the parsed command line arguments."""
+    # NOTE: The API is imported here so that `--help` and argument errors
+    # don't pay for loading `requests` and its dependencies.
+    from .output import write_if_changed
+    from .api import (
+        ObservableAPI,
+        directory_cache,
+        NotebookAPI,
+        notebook_load,
+        notebook_parse_file,
+        notebook_md,
+        notebook_js,
+        notebook_bundle,
+        notebook_json,
+        notebook_dependencies,
+    )
+
+    if args.cache:
+        ObservableAPI.Get().cache = directory_cache(args.cache)
+    if args.lock:
+        from .lock import Lockfile
+
+        try:
+            NotebookAPI.Get().lock(Lockfile.Load(args.lock))
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            sys.stderr.write(f"!!! ERR Could not load lockfile {args.lock}: {e}\n")
+            sys.stderr.flush()
+            return 1
+    if args.rate is not None or args.concurrency is not None:
+        ObservableAPI.Get().scheduler.configure(
+            rate=args.rate, concurrency=args.concurrency
+        )
 
     # We get the format type from the args or the output format
     output_ext = args.output.rsplit(".")[-1].lower() if "." in args.output else None
     output_format = args.type or output_ext or "js"
     output_format = ({"ojs": "raw"}).get(output_format, output_format)
+    is_directory = bool(
+        args.output and (args.output.endswith("/") or os.path.isdir(args.output))
+    )
+    if is_directory:
+        output_format = args.type or "js"
+
+    # Cells are selected while parsing, so that the excluded cells are
+    # never stored. Anonymous cells are not rendered as JavaScript with
+    # `--named`, so we don't even keep them.
+    selector = Selector(
+        include=args.include or (),
+        exclude=args.ignore or (),
+        types=args.cell_type or (),
+        sources=args.source or (),
+        isNamed=args.named and output_format in ("js", "bundle"),
+    )
+    entries: list[str] = [
+        _.strip() for e in args.entry or () for _ in e.split(",") if _.strip()
+    ]
+
+    # When the output is a directory, each notebook is exported to its own
+    # file, in parallel.
+    if is_directory:
+        return export_directory(args, output_format, selector, entries)
+    elif args.with_dependencies:
+        sys.stderr.write(
+            "!!! ERR --with-dependencies exports to a directory, use -o dir/\n"
+        )
+        sys.stderr.flush()
+        return 1
+
+    # Raw exports are streamed as they are, without being parsed.
+    if output_format == "raw" and not args.dependencies:
+        return export_raw(args)
 
     notebooks: list[Notebook] = []
-    # NOTE: This is a bit awkward, but we do not need to parse the notebooks
-    # just yet if we're using the dependencies.
-    notebook_sources: list[str] = []
     if not args.dependencies:
         for name in args.notebook:
-            try:
-                notebook_source = notebook_get(name, key=args.api_key)
-            except RuntimeError as e:
-                sys.stderr.write(f"!!! ERR {e}\n")
-                sys.stderr.flush()
-                return 1
-
-            notebook_sources.append(notebook_source)
-            notebook = (
-                notebook_parse(notebook_source) if output_format != "raw" else None
-            )
-            if args.ignore and isinstance(notebook, Notebook):
-                notebook = Notebook(
-                    id=notebook.id,
-                    cells=[_ for _ in notebook.cells if matches(_.name, args.ignore)],
-                )
+            # Local files (or `-` for stdin) are raw exports that we parse
+            # directly, without going through the API.
+            if isLocal(name):
+                notebook = notebook_parse_file(name, selector)
+                if not notebook:
+                    sys.stderr.write(f"!!! ERR Could not parse notebook: {name}\n")
+                    sys.stderr.flush()
+                    return 1
+            else:
+                try:
+                    notebook = notebook_load(name, key=args.api_key, selector=selector)
+                except RuntimeError as e:
+                    sys.stderr.write(f"!!! ERR {e}\n")
+                    sys.stderr.flush()
+                    return 1
+            if entries and isinstance(notebook, Notebook):
+                for entry in entries:
+                    if entry not in notebook.index:
+                        sys.stderr.write(
+                            f"!!! ERR Cell not found in {notebook.id}: {entry}\n"
+                        )
+                        sys.stderr.flush()
+                        return 1
+                notebook = notebook.entry(entries)
             if notebook:
                 notebooks.append(notebook)
 
@@ -117,9 +266,6 @@ def run(args=sys.argv[1:]):
                 )
             else:
                 out.write(json.dumps(deps))
-        elif output_format == "raw":
-            for _ in notebook_sources:
-                out.write(_)
         elif output_format == "json":
             if len(notebooks) == 1:
                 out.write(notebook_json(notebooks[0]))
@@ -158,19 +304,507 @@ def run(args=sys.argv[1:]):
                 out.write("\nexport const __all__ = {")
                 out.write(", ".join(_ for _ in manifest))
                 out.write("};\n")
-
+        elif output_format == "bundle":
+            for notebook in notebooks:
+                assert notebook and isinstance(notebook, Notebook)
+                for line in notebook_bundle(
+                    notebook,
+                    transitiveExports=args.transitive_exports,
+                    withAnonymous=False if args.named else True,
+                    withPreprocessed=False if args.named else True,
+                    key=args.api_key,
+                ):
+                    out.write(line)
         else:
             raise ValueError(
-                "Supported types are json, js or md, got: {output_format} "
+                f"Supported types are json, js, bundle, md or raw, got: {output_format} "
             )
         out.flush()
         return 0
 
-    if args.output:
-        with open(args.output, "w") as f:
-            return write(f)
+    try:
+        if args.output:
+            # We render in a buffer so that the output file is only replaced
+            # when its content changed.
+            buffer = io.StringIO()
+            res = write(buffer)
+            write_if_changed(args.output, buffer.getvalue())
+            return res
+        else:
+            return write(sys.stdout)
+    except RuntimeError as e:
+        # Dependencies are loaded while writing, which may fail (for
+        # instance when they don't match the lockfile).
+        sys.stderr.write(f"!!! ERR {e}\n")
+        sys.stderr.flush()
+        return 1
+
+
+def export_raw(args: argparse.Namespace) -> int:
+    """Streams the raw exports of the notebooks to the output, chunk by
+    chunk, so that they are never decoded nor held in memory as a whole."""
+    from .api import notebook_stream
+    from .output import AtomicOutput, copy, copychunks
+
+    def write(out: BinaryIO):
+        for name in args.notebook:
+            if name == "-":
+                copychunks(sys.stdin.buffer, out)
+            elif isLocal(name):
+                copy(name, out)
+            else:
+                notebook_stream(name, out, key=args.api_key)
+        out.flush()
+
+    try:
+        if args.output:
+            with AtomicOutput(args.output) as f:
+                write(f)
+        else:
+            sys.stdout.flush()
+            write(sys.stdout.buffer)
+    except RuntimeError as e:
+        sys.stderr.write(f"!!! ERR {e}\n")
+        sys.stderr.flush()
+        return 1
+    return 0
+
+
+def export_directory(
+    args: argparse.Namespace,
+    output_format: str,
+    selector: Selector,
+    entries: list[str],
+) -> int:
+    """Exports each notebook to its own file in the `args.output` directory,
+    parsing and rendering them in a process pool. With `--with-dependencies`,
+    the whole dependency graph is exported from the notebooks parsed while
+    crawling it."""
+    from .bulk import export_bulk, export_graph
+
+    # The manifest and `__all__` aggregate the cells of all the notebooks
+    # in a single output, and the notebooks of a graph are exported whole,
+    # as their dependents may import any of their cells.
+    unsupported: list[str] = [
+        option
+        for option, isSet in (
+            ("--manifest", args.manifest),
+            ("--all", args.all),
+            ("-d", args.dependencies),
+        )
+        if isSet
+    ]
+    if args.with_dependencies:
+        unsupported += [
+            option
+            for option, isSet in (
+                ("-i", args.ignore),
+                ("--include", args.include),
+                ("--cell-type", args.cell_type),
+                ("--source", args.source),
+                ("--entry", entries),
+            )
+            if isSet
+        ]
+    if unsupported:
+        sys.stderr.write(
+            f"!!! ERR Not supported when exporting to a directory: {', '.join(unsupported)}\n"
+        )
+        sys.stderr.flush()
+        return 1
+
+    options = (
+        {}
+        if output_format in ("md", "json", "raw")
+        else dict(
+            transitiveExports=args.transitive_exports,
+            withAnonymous=False if args.named else True,
+            withPreprocessed=False if args.named else True,
+        )
+    )
+    failed: int = 0
+    written: int = 0
+    skipped: int = 0
+    results = (
+        export_graph(
+            args.notebook,
+            args.output,
+            format=output_format,
+            key=args.api_key,
+            **options,
+        )
+        if args.with_dependencies
+        else export_bulk(
+            args.notebook,
+            args.output,
+            format=output_format,
+            key=args.api_key,
+            jobs=args.jobs,
+            selector=selector,
+            entries=entries,
+            **options,
+        )
+    )
+    for result in results:
+        if result.error:
+            failed += 1
+            sys.stderr.write(f"!!! ERR {result.notebook}: {result.error}\n")
+        elif result.written:
+            written += 1
+        else:
+            skipped += 1
+    sys.stderr.write(
+        f"--- Exported {written + skipped} notebook(s): {written} written, {skipped} unchanged, {failed} failed\n"
+    )
+    sys.stderr.flush()
+    return 1 if failed else 0
+
+
+def query(args: list[str]) -> int:
+    """Queries the dependency graph of the cells of a notebook."""
+    parser = argparse.ArgumentParser(
+        prog="observable-export query",
+        description="Queries the dependency graph of the cells of a notebook.",
+    )
+    parser.add_argument(
+        "query",
+        choices=["impact", "ancestry", "dependents", "inputs"],
+        help="'impact' lists the cells affected by a change of the given cells, 'ancestry' the cells they depend on, 'dependents' and 'inputs' only the direct ones",
+    )
+    parser.add_argument(
+        "notebook", help="The name or ID of the notebook, or a local raw export"
+    )
+    parser.add_argument("cell", nargs="+", help="The names of the cells to query")
+    parser.add_argument("-k", "--api-key", help="Sets the API key to use")
+    parser.add_argument(
+        "-t", "--type", help="Supports the output type: 'json' (default), 'raw' or 'md'"
+    )
+    options = parser.parse_args(args)
+    try:
+        notebook = load(options.notebook, options.api_key)
+    except RuntimeError as e:
+        sys.stderr.write(f"!!! ERR {e}\n")
+        sys.stderr.flush()
+        return 1
+
+    res: dict[str, list[str]] = {}
+    for name in options.cell:
+        if name not in notebook.index:
+            sys.stderr.write(f"!!! ERR Cell not found in {notebook.id}: {name}\n")
+            sys.stderr.flush()
+            return 1
+        if options.query == "impact":
+            res[name] = [_.name for _ in notebook.impact(name)]
+        elif options.query == "ancestry":
+            res[name] = [_.name for _ in notebook.ancestry(name)]
+        elif options.query == "dependents":
+            res[name] = list(notebook.dependents.get(name, ()))
+        else:
+            res[name] = list(notebook.index[name].inputs)
+
+    if options.type == "raw":
+        for name in dict.fromkeys(_ for v in res.values() for _ in v):
+            sys.stdout.write(f"{name}\n")
+    elif options.type == "md":
+        for name, cells in res.items():
+            sys.stdout.write(f"- `{name}`: {', '.join(f'`{_}`' for _ in cells)}\n")
+    else:
+        json.dump(res, sys.stdout)
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+    return 0
+
+
+def index(args: list[str]) -> int:
+    """Builds, updates and queries an index of the symbols defined and
+    imported by notebooks."""
+    parser = argparse.ArgumentParser(
+        prog="observable-export index",
+        description="Builds, updates and queries an index of the symbols defined and imported by notebooks.",
+    )
+    parser.add_argument(
+        "notebook",
+        nargs="*",
+        help="The notebooks (names, ids or local raw exports) to add to the index",
+    )
+    parser.add_argument(
+        "-f",
+        "--file",
+        default="symbols.db",
+        help="The path of the index file (default: symbols.db)",
+    )
+    parser.add_argument(
+        "-d",
+        "--dependencies",
+        action="store_true",
+        help="Also indexes the dependencies of the given notebooks",
+    )
+    parser.add_argument(
+        "-l",
+        "--lookup",
+        action="append",
+        help="Lists the notebooks defining or importing the given symbol",
+    )
+    parser.add_argument("-k", "--api-key", help="Sets the API key to use")
+    options = parser.parse_args(args)
+    from .symbols import SymbolIndex, symbols_index
+
+    with SymbolIndex(options.file) as symbols:
+        if options.notebook:
+            try:
+                indexed, skipped = symbols_index(
+                    symbols,
+                    options.notebook,
+                    key=options.api_key,
+                    withDependencies=options.dependencies,
+                )
+            except RuntimeError as e:
+                sys.stderr.write(f"!!! ERR {e}\n")
+                sys.stderr.flush()
+                return 1
+            sys.stderr.write(
+                f"--- Indexed {indexed} notebook(s), {skipped} already up to date\n"
+            )
+            sys.stderr.flush()
+        if options.lookup:
+            json.dump(
+                {_: [s._asdict() for s in symbols.lookup(_)] for _ in options.lookup},
+                sys.stdout,
+            )
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+    return 0
+
+
+def diff(args: list[str]) -> int:
+    """Lists the cells added, removed, modified and moved between two
+    versions of a notebook."""
+    parser = argparse.ArgumentParser(
+        prog="observable-export diff",
+        description="Lists the cells added, removed, modified and moved between two versions of a notebook.",
+    )
+    parser.add_argument(
+        "before", help="The name or ID of the notebook, or a local raw export"
+    )
+    parser.add_argument(
+        "after", help="The name or ID of the notebook, or a local raw export"
+    )
+    parser.add_argument(
+        "-i",
+        "--impact",
+        action="store_true",
+        help="Also lists the cells affected by the changes",
+    )
+    parser.add_argument("-k", "--api-key", help="Sets the API key to use")
+    parser.add_argument(
+        "-t", "--type", help="Supports the output type: 'json' (default), 'raw' or 'md'"
+    )
+    options = parser.parse_args(args)
+    from .diff import diff as notebook_diff, ADDED, REMOVED, MODIFIED, MOVED
+
+    try:
+        before = load(options.before, options.api_key)
+        after = load(options.after, options.api_key)
+    except RuntimeError as e:
+        sys.stderr.write(f"!!! ERR {e}\n")
+        sys.stderr.flush()
+        return 1
+
+    changes = notebook_diff(before, after)
+    # The cells affected by the changes, in the `after` notebook
+    impacted: list[str] = []
+    if options.impact:
+        changed = {_.name for _ in changes if _.change != REMOVED}
+        impacted = [
+            _.name
+            for _ in after.walk(
+                changed, after.index, lambda _: after.dependents.get(_, ())
+            )
+            if _.name not in changed
+        ]
+
+    if options.type == "raw":
+        symbols = {ADDED: "+", REMOVED: "-", MODIFIED: "~", MOVED: ">"}
+        for change in changes:
+            sys.stdout.write(f"{symbols[change.change]} {change.name}\n")
+        for name in impacted:
+            sys.stdout.write(f"! {name}\n")
+    elif options.type == "md":
+        for change in changes:
+            sys.stdout.write(f"- {change.change} `{change.name}`\n")
+        for name in impacted:
+            sys.stdout.write(f"- impacted `{name}`\n")
+    else:
+        res: dict = {"changes": [_._asdict() for _ in changes]}
+        if options.impact:
+            res["impacted"] = impacted
+        json.dump(res, sys.stdout)
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+    return 0
+
+
+def bisect(args: list[str]) -> int:
+    """Finds the version of a notebook that introduced the current state
+    of a cell."""
+    parser = argparse.ArgumentParser(
+        prog="observable-export bisect",
+        description="Finds the version of a notebook that introduced the current state of a cell, by bisecting its versions.",
+    )
+    parser.add_argument("notebook", help="The name or ID of the notebook")
+    parser.add_argument("cell", help="The name of the cell")
+    parser.add_argument(
+        "--from",
+        dest="lower",
+        type=int,
+        default=1,
+        help="The first version to consider (default: 1)",
+    )
+    parser.add_argument(
+        "--to",
+        dest="upper",
+        type=int,
+        help="The version of the cell state to look for (default: latest)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=3,
+        help="The number of versions fetched in parallel at each step (default: 3)",
+    )
+    parser.add_argument("-k", "--api-key", help="Sets the API key to use")
+    parser.add_argument(
+        "-t", "--type", help="Supports the output type: 'json' (default) or 'raw'"
+    )
+    options = parser.parse_args(args)
+    from .diff import notebook_bisect
+
+    try:
+        revision = notebook_bisect(
+            options.notebook,
+            options.cell,
+            key=options.api_key,
+            lower=options.lower,
+            upper=options.upper,
+            jobs=options.jobs,
+        )
+    except RuntimeError as e:
+        sys.stderr.write(f"!!! ERR {e}\n")
+        sys.stderr.flush()
+        return 1
+
+    if options.type == "raw":
+        sys.stdout.write(f"{revision.version if revision else ''}\n")
     else:
-        return write(sys.stdout)
+        json.dump(revision._asdict() if revision else None, sys.stdout)
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+    return 0
+
+
+def lock(args: list[str]) -> int:
+    """Writes a lockfile pinning the given notebooks and their dependencies
+    to their current versions."""
+    from .lock import LOCKFILE, notebook_lock
+
+    parser = argparse.ArgumentParser(
+        prog="observable-export lock",
+        description="Writes a lockfile pinning the given notebooks and their dependencies to their current versions, with the hashes of their exports.",
+    )
+    parser.add_argument(
+        "notebook", nargs="+", help="The names or IDs of the notebooks to lock"
+    )
+    parser.add_argument(
+        "-f",
+        "--file",
+        default=LOCKFILE,
+        help=f"The path of the lockfile (default: {LOCKFILE})",
+    )
+    parser.add_argument("-k", "--api-key", help="Sets the API key to use")
+    options = parser.parse_args(args)
+    try:
+        lockfile = notebook_lock(options.notebook, key=options.api_key)
+    except RuntimeError as e:
+        sys.stderr.write(f"!!! ERR {e}\n")
+        sys.stderr.flush()
+        return 1
+    written = lockfile.save(options.file)
+    sys.stderr.write(
+        f"--- Locked {len(lockfile.refs)} notebook(s) in {options.file}{'' if written else ' (unchanged)'}\n"
+    )
+    sys.stderr.flush()
+    return 0
+
+
+def serve(args: list[str]) -> int:
+    """Serves the exports of notebooks over HTTP."""
+    parser = argparse.ArgumentParser(
+        prog="observable-export serve",
+        description="Serves the exports of notebooks over HTTP, as /@user/name@version.js (or .md, .json), keeping the rendered exports warm.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="The host to bind to")
+    parser.add_argument(
+        "-p", "--port", type=int, default=8000, help="The port to listen on"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=32,
+        help="The number of threads handling the requests (default: 32)",
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=60.0,
+        help="The number of seconds after which unversioned names are resolved again (default: 60)",
+    )
+    parser.add_argument("-k", "--api-key", help="Sets the API key to use")
+    parser.add_argument(
+        "-n", "--named", action="store_true", help="Only includes named cells"
+    )
+    parser.add_argument(
+        "-e",
+        "--transitive-exports",
+        action="store_true",
+        help="Notebooks re-export their imported symbols (js only)",
+    )
+    parser.add_argument(
+        "--cache",
+        help="Caches the API responses in the given directory (defaults to $OBSERVABLE_CACHE)",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Doesn't log the requests"
+    )
+    options = parser.parse_args(args)
+    from .server import serve as serve_exports
+
+    if options.cache:
+        from .api import ObservableAPI, directory_cache
+
+        ObservableAPI.Get().cache = directory_cache(options.cache)
+    serve_exports(
+        options.host,
+        options.port,
+        key=options.api_key,
+        threads=options.threads,
+        ttl=options.ttl,
+        isQuiet=options.quiet,
+        transitiveExports=options.transitive_exports,
+        withAnonymous=not options.named,
+        withPreprocessed=not options.named,
+    )
+    return 0
+
 
+# The sub-commands, given as the first argument
+COMMANDS = {
+    "query": query,
+    "index": index,
+    "diff": diff,
+    "bisect": bisect,
+    "lock": lock,
+    "serve": serve,
+}
 
 # EOF
@@ -0,0 +1,146 @@
+from .model import Notebook, NotebookRef
+from typing import Optional, NamedTuple
+from bisect import bisect_left
+
+__doc__ = """
+Cell-level differences between two versions of a notebook. Cells are
+matched by name (anonymous cells by content) and compared by their
+fingerprints, which are computed once per parsed notebook. The version
+that introduced the current state of a cell is found by bisecting the
+notebook's versions.
+"""
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+MOVED = "moved"
+
+
+class Change(NamedTuple):
+    """A change of a cell between two versions of a notebook, `before` and
+    `after` being the positions of the cell in each version."""
+
+    name: str
+    change: str
+    before: Optional[int] = None
+    after: Optional[int] = None
+
+
+def diff(before: Notebook, after: Notebook) -> list[Change]:
+    """Returns the cells added, removed, modified and moved between the two
+    given notebooks, in the order of the `after` notebook, followed by the
+    removed cells. Cells are moved when their position relative to the
+    other common cells changed, the longest sequence of common cells in the
+    same order being considered in place."""
+    a = before.fingerprints
+    b = after.fingerprints
+    positions = {k: i for i, k in enumerate(a)}
+    common: list[str] = [_ for _ in b if _ in positions]
+    in_place = stable(common, positions)
+    changes: list[Change] = []
+    for i, (k, (fingerprint, cell)) in enumerate(b.items()):
+        j = positions.get(k)
+        if j is None:
+            changes.append(Change(cell.name, ADDED, None, i))
+        elif a[k][0] != fingerprint:
+            changes.append(Change(cell.name, MODIFIED, j, i))
+        elif k not in in_place:
+            changes.append(Change(cell.name, MOVED, j, i))
+    for k, (_, cell) in a.items():
+        if k not in b:
+            changes.append(Change(cell.name, REMOVED, positions[k], None))
+    return changes
+
+
+def stable(keys: list[str], positions: dict[str, int]) -> set[str]:
+    """Returns the longest subsequence of the given keys whose positions are
+    increasing, in `O(n log n)`. These are the cells that didn't move."""
+    # The positions ending the increasing subsequences of each length, and
+    # the index of the key ending them.
+    tails: list[int] = []
+    ends: list[int] = []
+    previous: list[int] = []
+    for i, k in enumerate(keys):
+        p = positions[k]
+        n = bisect_left(tails, p)
+        if n == len(tails):
+            tails.append(p)
+            ends.append(i)
+        else:
+            tails[n] = p
+            ends[n] = i
+        previous.append(ends[n - 1] if n else -1)
+    res: set[str] = set()
+    i = ends[-1] if ends else -1
+    while i >= 0:
+        res.add(keys[i])
+        i = previous[i]
+    return res
+
+
+class Revision(NamedTuple):
+    """The version that introduced the current state of a cell, which was
+    either `added` or `modified` since the `previous` version."""
+
+    cell: str
+    version: int
+    previous: int
+    change: str
+
+
+def notebook_bisect(
+    notebook: str,
+    cell: str,
+    key: Optional[str] = None,
+    lower: int = 1,
+    upper: Optional[int] = None,
+    jobs: int = 3,
+) -> Optional[Revision]:
+    """Finds the version of the given notebook that introduced the current
+    state of the given cell (its state at the `upper` version, the latest by
+    default), assuming the cell didn't change back and forth in between.
+    Each step probes `jobs` versions in parallel, speculatively fetching
+    the versions the next steps would probe: with the default of 3, a step
+    bisects the range twice. Returns `None` when the cell is the same at
+    the `lower` version."""
+    from .api import NotebookAPI
+    from concurrent.futures import ThreadPoolExecutor
+
+    api = NotebookAPI.Get()
+    ref = api.resolve(notebook, key)
+    upper = ref.version if upper is None else upper
+
+    def fingerprint(version: int) -> Optional[str]:
+        loaded = api.load(
+            NotebookRef(
+                id=ref.id, version=version, username=ref.username, name=ref.name
+            ),
+            key,
+        )
+        if not loaded:
+            raise RuntimeError(f"Could not load notebook: {ref.id}@{version}")
+        entry = loaded.fingerprints.get(cell)
+        return entry[0] if entry else None
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        target, first = pool.map(fingerprint, (upper, lower))
+        if target is None:
+            raise RuntimeError(f"Cell not found in {ref.id}@{upper}: {cell}")
+        if first == target:
+            return None
+        # The cell is in its current state at `hi`, and was not at `lo`
+        lo, hi = lower, upper
+        states: dict[int, Optional[str]] = {lo: first}
+        while hi - lo > 1:
+            n = min(max(1, jobs), hi - lo - 1)
+            probes = sorted({lo + (hi - lo) * (i + 1) // (n + 1) for i in range(n)})
+            states.update(zip(probes, pool.map(fingerprint, probes)))
+            for version in probes:
+                if states[version] == target:
+                    hi = version
+                    break
+                lo = version
+    return Revision(cell, hi, lo, ADDED if states[lo] is None else MODIFIED)
+
+
+# EOF
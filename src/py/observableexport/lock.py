@@ -0,0 +1,95 @@
+from .model import NotebookRef
+from .output import write_if_changed
+from typing import Optional, Iterable
+from dataclasses import dataclass, field
+import hashlib
+import json
+
+__doc__ = """
+Lockfiles pin the notebooks of a dependency graph to exact versions, along
+with the SHA-256 hash of their exports. Builds using a lockfile don't
+resolve any notebook name with the API, only fetch immutable versioned
+exports (which are fully cacheable), and fail when an export doesn't match
+its hash.
+"""
+
+# The version of the lockfile format
+LOCKFILE_VERSION = 1
+# The default path of the lockfile
+LOCKFILE = "observable-lock.json"
+
+
+@dataclass
+class Lockfile:
+    """The pinned references of notebooks, by key (`<id>@<version>`), with
+    the names that resolve to them and the hashes of their exports."""
+
+    refs: dict[str, NotebookRef] = field(default_factory=dict)
+    hashes: dict[str, str] = field(default_factory=dict)
+    names: dict[str, str] = field(default_factory=dict)
+
+    @staticmethod
+    def Load(path: str) -> "Lockfile":
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != LOCKFILE_VERSION:
+            raise RuntimeError(
+                f"Unsupported lockfile version in {path}: {data.get('version')}"
+            )
+        lock = Lockfile()
+        for key, item in data["notebooks"].items():
+            lock.refs[key] = NotebookRef(
+                id=item["id"],
+                version=int(item["version"]),
+                username=item.get("username"),
+                name=item.get("name"),
+            )
+            lock.hashes[key] = item["sha256"]
+        lock.names = dict(data["names"])
+        return lock
+
+    def asDict(self) -> dict:
+        return dict(
+            version=LOCKFILE_VERSION,
+            names=dict(sorted(self.names.items())),
+            notebooks={
+                k: dict(
+                    id=ref.id,
+                    version=ref.version,
+                    username=ref.username,
+                    name=ref.name,
+                    sha256=self.hashes[k],
+                )
+                for k, ref in sorted(self.refs.items())
+            },
+        )
+
+    def save(self, path: str) -> bool:
+        """Writes the lockfile, returning `True` when it changed."""
+        return write_if_changed(path, json.dumps(self.asDict(), indent=2) + "\n")
+
+
+def notebook_lock(notebooks: Iterable[str], key: Optional[str] = None) -> Lockfile:
+    """Crawls the dependencies of the given notebooks once, pinning each of
+    them to its resolved version and hashing its export."""
+    from .api import NotebookAPI
+
+    api = NotebookAPI.Get()
+    names = list(notebooks)
+    lock = Lockfile()
+    for ref in api.dependencies(*names, key=key):
+        h = hashlib.sha256()
+        for chunk in api.chunks(ref, key):
+            h.update(chunk)
+        lock.refs[ref.key] = ref
+        lock.hashes[ref.key] = h.hexdigest()
+    # The names given and imported that resolved to the pinned notebooks
+    lock.names = {
+        name: ref.key
+        for name, ref in api.resolved.items()
+        if ref.key in lock.refs and name != ref.key
+    }
+    return lock
+
+
+# EOF
@@ -0,0 +1,138 @@
+from typing import Optional, Any
+from bisect import bisect_left
+import threading
+import json
+import sys
+
+__doc__ = """
+Counters and latency histograms for the network and cache layers, so that
+cache sizes and concurrency can be tuned from actual data.
+"""
+
+# Upper bounds (in seconds) of the latency histogram buckets, the last
+# bucket catches everything above.
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    """A fixed-bucket histogram of latencies, in seconds."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets: tuple[float, ...] = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def add(self, value: float) -> "Histogram":
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        return self
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def asDict(self) -> dict:
+        return dict(
+            count=self.count,
+            mean=self.mean,
+            max=self.max,
+            buckets={
+                (f"{b}" if i < len(self.buckets) else "inf"): c
+                for i, (b, c) in enumerate(
+                    zip(self.buckets + (float("inf"),), self.counts)
+                )
+            },
+        )
+
+
+class Metrics:
+    """A thread-safe registry of counters and per-endpoint latency
+    histograms."""
+
+    def __init__(self):
+        self.counters: dict[str, int] = {}
+        self.latencies: dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: int = 1) -> "Metrics":
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        return self
+
+    def get(self, name: str) -> int:
+        return self.counters.get(name, 0)
+
+    def hit(self, layer: str) -> "Metrics":
+        return self.inc(f"cache.{layer}.hits")
+
+    def miss(self, layer: str) -> "Metrics":
+        return self.inc(f"cache.{layer}.misses")
+
+    def ratio(self, layer: str) -> Optional[float]:
+        """Returns the hit ratio for the given cache layer, if any."""
+        hits = self.get(f"cache.{layer}.hits")
+        total = hits + self.get(f"cache.{layer}.misses")
+        return hits / total if total else None
+
+    def latency(self, endpoint: str, elapsed: float) -> "Metrics":
+        with self.lock:
+            histogram = self.latencies.get(endpoint)
+            if histogram is None:
+                histogram = self.latencies[endpoint] = Histogram()
+            histogram.add(elapsed)
+        return self
+
+    def reset(self) -> "Metrics":
+        with self.lock:
+            self.counters = {}
+            self.latencies = {}
+        return self
+
+    def report(self) -> dict[str, Any]:
+        """Returns the metrics as a JSON-serialisable dictionary"""
+        with self.lock:
+            return dict(
+                counters=dict(sorted(self.counters.items())),
+                latencies={k: v.asDict() for k, v in sorted(self.latencies.items())},
+            )
+
+    def dump(self, path: str):
+        """Writes the metrics as JSON to the given path, `-` being stderr."""
+        if path == "-":
+            json.dump(self.report(), sys.stderr, indent=2)
+            sys.stderr.write("\n")
+        else:
+            with open(path, "w") as f:
+                json.dump(self.report(), f, indent=2)
+                f.write("\n")
+
+
+def endpoint(url: str) -> str:
+    """Returns the endpoint name for the given API path, so that latencies
+    are aggregated per kind of request rather than per notebook."""
+    path = url.split("?", 1)[0]
+    head = path.split("/", 1)[0]
+    if head.startswith("@"):
+        return "notebook"
+    elif head == "d":
+        return "d"
+    else:
+        return head or "/"
+
+
+# EOF
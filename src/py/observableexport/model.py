@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 import re
-from typing import Optional, NamedTuple, Union
-from graphlib import TopologicalSorter
+import hashlib
+from typing import Optional, NamedTuple, Union, Iterable, Callable, Any
 from dataclasses import dataclass
+from .profiling import span
 
 __doc__ = """
 Parses ObservableHQ notebook API `https://api.observablehq.com/{notebook}.js`,
@@ -37,6 +38,7 @@ for s in DEFINED_SYMBOLS:
 NOTEBOOK_NAME = r"@?(?P<username>[a-zA-Z0-9_\-]+)/(?P<name>[a-zA-Z0-9_\-]+)"
 NOTEBOOK_HASH = f"(?P<id>{'[0-9a-f]' * 16})"
 NOTEBOOK_REV = r"(@(?P<rev>\d+))?"
+RE_VERSION = re.compile(r"@\d+$")
 RE_NOTEBOOK_PUBLIC = re.compile(f"^{NOTEBOOK_NAME}{NOTEBOOK_REV}$")
 RE_NOTEBOOK_PRIVATE = re.compile(f"^{NOTEBOOK_HASH}{NOTEBOOK_REV}$")
 RE_NOTEBOOK = re.compile(
@@ -84,6 +86,9 @@ class Cell:
 
     RE_PREPROCESSED = re.compile(r"^\w+`")
     RE_ANONYMOUS = re.compile(r"^__CELL_\d+__$")
+    # Prefixes of the Observable-specific cells generated for views and
+    # mutables.
+    SPECIAL_PREFIXES = ("viewof_", "initial_", "mutable_")
 
     def __init__(
         self,
@@ -132,6 +137,12 @@ class Cell:
             and self.RE_PREPROCESSED.match(self.value[0])
         )
 
+    @property
+    def isSpecial(self) -> bool:
+        """A special cell is an Observable-specific view or mutable cell,
+        which is not exported as JavaScript."""
+        return self.name.startswith(self.SPECIAL_PREFIXES)
+
     @property
     def isEmpty(self) -> bool:
         """And empty cell has no value"""
@@ -153,6 +164,23 @@ class Cell:
                 + "".join(self.value)
             )
 
+    def fingerprint(self, origin: Optional[str] = None) -> str:
+        """Returns a hash of the cell name, type, inputs and body, and of the
+        given `origin` (the unversioned notebook imported cells come from),
+        which changes whenever the cell changes. The name of anonymous cells
+        is not part of it, as it depends on their position, and neither is
+        the version of the notebook."""
+        h = hashlib.sha1()
+        name = "" if self.isAnonymous else self.name
+        for _ in (name, self.type, origin or "", self.sourceName or ""):
+            h.update(_.encode("utf8"))
+            h.update(b"\0")
+        h.update(",".join(self.inputs).encode("utf8"))
+        h.update(b"\0")
+        for line in self.value:
+            h.update(line.encode("utf8"))
+        return h.hexdigest()
+
     def addLine(self, line: str) -> "Cell":
         self.value.append(line)
         return self
@@ -200,7 +228,16 @@ class Notebook:
     def __init__(self, id: Optional[str] = None, cells: Optional[list[Cell]] = None):
         self.id: Optional[str] = id
         self._cells: list[Cell] = cells or []
+        # The number of cells added so far, which gives the index of the
+        # next cell even when cells are removed.
+        self.cellCount: int = len(self._cells)
+        # Values derived from the cells (indexes), which are maintained until
+        # the cells change.
+        self._derived: dict[str, Any] = {}
         self.areCellsDirty: bool = True
+        # The names of the cells this notebook was restricted to, if any (see
+        # `entry`), whose imports are kept even when no defined cell uses them.
+        self.entries: set[str] = set()
 
     @property
     def isPrivate(self) -> bool:
@@ -216,11 +253,66 @@ class Notebook:
         """Returns the cells in this notebook. This takes care of normalising
         the cells when necessary."""
         if self.areCellsDirty:
-            self._cells = self.normaliseCells(self._cells)
-            self.areCellsDirty = False
-        self._cells = self.normaliseCells(self._cells)
+            with span("notebook.normalise"):
+                self._cells = self.normaliseCells(self._cells)
+                self._derived = {}
+                self.areCellsDirty = False
         return self._cells
 
+    @property
+    def index(self) -> dict[str, Cell]:
+        """Returns the cells by name, where defined cells shadow the imported
+        cells with the same name. The index is maintained until the cells
+        change."""
+        cells = self.cells
+        if "index" not in self._derived:
+            index: dict[str, Cell] = {}
+            for cell in cells:
+                if cell.name not in index or cell.source in (None, self.id):
+                    index[cell.name] = cell
+            self._derived["index"] = index
+        return self._derived["index"]
+
+    @property
+    def dependents(self) -> dict[str, list[str]]:
+        """Returns the reverse index of the cell inputs, mapping cell names
+        to the names of the cells that use them as inputs. The index is
+        maintained until the cells change."""
+        index = self.index
+        if "dependents" not in self._derived:
+            dependents: dict[str, list[str]] = {}
+            for cell in index.values():
+                for name in cell.inputs:
+                    dependents.setdefault(name, []).append(cell.name)
+            self._derived["dependents"] = dependents
+        return self._derived["dependents"]
+
+    @property
+    def fingerprints(self) -> dict[str, tuple[str, Cell]]:
+        """Returns the fingerprints of the cells in their original order,
+        keyed by cell name. Anonymous cells, whose names depend on their
+        position, are keyed by their fingerprint instead. The fingerprints
+        are maintained until the cells change."""
+        cells = self.cells
+        if "fingerprints" not in self._derived:
+            fingerprints: dict[str, tuple[str, Cell]] = {}
+            occurrences: dict[str, int] = {}
+            for cell in sorted(cells, key=lambda _: _.index):
+                # NOTE: The versioned id of the notebook would change every
+                # fingerprint on each new version.
+                origin = (
+                    None
+                    if cell.source in (None, self.id)
+                    else RE_VERSION.sub("", cell.source)
+                )
+                fingerprint = cell.fingerprint(origin)
+                key = f"#{fingerprint}" if cell.isAnonymous else cell.name
+                # Identical anonymous cells are told apart by their occurrence
+                n = occurrences[key] = occurrences.get(key, 0) + 1
+                fingerprints[key if n == 1 else f"{key}:{n}"] = (fingerprint, cell)
+            self._derived["fingerprints"] = fingerprints
+        return self._derived["fingerprints"]
+
     @property
     def cellsByName(self) -> dict[str, Cell]:
         """Returns the cells by name."""
@@ -238,14 +330,20 @@ class Notebook:
     @property
     def dependencies(self) -> dict[str, list[Cell]]:
         """Returns a map of cell names to their list of dependencies."""
-        depends = set()
-        for cell in self.defined:
-            for _ in cell.inputs:
-                depends.add(_)
-        return {
-            k: list(set(_ for _ in v if _.name in depends))
-            for (k, v) in self.imported.items()
-        }
+        # NOTE: Accessing the cells resets the derived values if they changed
+        self.cells
+        if "dependencies" not in self._derived:
+            depends = set(self.entries)
+            for cell in self.defined:
+                for _ in cell.inputs:
+                    depends.add(_)
+            # NOTE: We preserve the cells order so that the output is stable
+            # across runs.
+            self._derived["dependencies"] = {
+                k: [_ for _ in v if _.name in depends]
+                for (k, v) in self.imported.items()
+            }
+        return self._derived["dependencies"]
 
     @property
     def imported(self) -> dict[str, list[Cell]]:
@@ -258,6 +356,60 @@ class Notebook:
                     cells.append(cell)
         return cells_by_source
 
+    def closure(self, names: Iterable[str]) -> list[Cell]:
+        """Returns the cells required to compute the cells with the given names,
+        including them, in dependency order. Defined cells shadow imported
+        cells with the same name, and names that are not cells of this notebook
+        (like builtins) are ignored."""
+        return self.walk(names, self.index, lambda _: self.index[_].inputs)
+
+    def entry(self, names: Iterable[str]) -> "Notebook":
+        """Returns a notebook with only the cells required to compute the
+        cells with the given names. Imported cells given as entries are kept
+        as dependencies, so that they are still imported."""
+        names = list(names)
+        notebook = Notebook(id=self.id, cells=self.closure(names))
+        notebook.entries = {_ for _ in names if _ in self.index}
+        return notebook
+
+    def ancestry(self, name: str) -> list[Cell]:
+        """Returns the cells that the given cell depends on, directly or
+        transitively, in dependency order."""
+        return [_ for _ in self.closure((name,)) if _.name != name]
+
+    def impact(self, name: str) -> list[Cell]:
+        """Returns the cells that depend on the given cell, directly or
+        transitively, in dependency order. These are the cells affected by
+        a change of the given cell."""
+        dependents = self.dependents
+        return [
+            _
+            for _ in self.walk(
+                dependents.get(name, ()),
+                self.index,
+                lambda _: dependents.get(_, ()),
+            )
+            if _.name != name
+        ]
+
+    def walk(
+        self,
+        names: Iterable[str],
+        index: dict[str, Cell],
+        edges: Callable[[str], Iterable[str]],
+    ) -> list[Cell]:
+        """Returns the cells reachable from the given names following the
+        given edges, in dependency order. This runs in time proportional to
+        the number of reached cells."""
+        reached: set[str] = set()
+        pending: list[str] = [_ for _ in names if _ in index]
+        while pending:
+            name = pending.pop()
+            if name not in reached:
+                reached.add(name)
+                pending += [_ for _ in edges(name) if _ in index and _ not in reached]
+        return sorted((index[_] for _ in reached), key=lambda _: _.order)
+
     def addCell(
         self,
         name: Optional[str],
@@ -269,21 +421,34 @@ class Notebook:
         if there is already a cell with the given name defined."""
         self._cells.append(
             Cell(
-                name if name else f"__CELL_{len(self._cells)}__",
+                name if name else f"__CELL_{self.cellCount}__",
                 source=source,
                 sourceName=sourceName,
                 type=type,
-                index=len(self._cells),
+                index=self.cellCount,
             )
         )
+        self.cellCount += 1
         self.areCellsDirty = True
         assert self.cell, f"Should not leave with a None cell"
         return self.cell
 
+    def removeCell(self, cell: Cell) -> "Notebook":
+        """Removes the given cell, which is typically the last one added. The
+        indexes of the other cells are left as they are."""
+        if self._cells and self._cells[-1] is cell:
+            self._cells.pop()
+        else:
+            self._cells.remove(cell)
+        self.areCellsDirty = True
+        return self
+
     def normaliseCells(self, cells: list[Cell]) -> list[Cell]:
         """Brute force prioritization of cells based on dependencies. This would
         fail with a cycle, but we assume that the Observable notebook contains
         none."""
+        from graphlib import TopologicalSorter
+
         # We apply the topological sort to get the order of each cell
         cells_map = {_.name: _ for _ in cells}
         cells_graph = {_.name: _.inputs for _ in cells}
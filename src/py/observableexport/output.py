@@ -0,0 +1,157 @@
+from typing import Union, Optional, BinaryIO
+import hashlib
+import os
+import tempfile
+import threading
+
+__doc__ = """
+Writes outputs atomically, and only when their content changed, so that
+downstream build caches and file watchers are not invalidated by
+byte-identical exports. Outputs can also be streamed to a temporary file,
+so that large exports are written in constant memory.
+"""
+
+# The size of the chunks used to hash and copy files
+CHUNK_SIZE = 64 * 1024
+
+
+def digest(path: str) -> str:
+    """Returns the SHA-256 hex digest of the file at the given path."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def umask() -> int:
+    """Returns the umask of the process. The umask can only be read by
+    setting it, which is process-global, so this is done once at import."""
+    # NOTE: Linux exposes the umask, which spares us from changing it.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    with UMASK_LOCK:
+        mask = os.umask(0o077)
+        os.umask(mask)
+    return mask
+
+
+UMASK_LOCK = threading.Lock()
+# The umask of the process, read at import time
+UMASK: int = umask()
+
+
+def permissions(path: str) -> int:
+    """Returns the permissions of the file at the given path, or the default
+    permissions of new files when it does not exist."""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        # NOTE: `mkstemp` creates the file as 0600, we want the same
+        # permissions as a regular `open()`.
+        return 0o666 & ~UMASK
+
+
+def write_if_changed(path: str, content: Union[str, bytes]) -> bool:
+    """Writes the given content to the given path, unless the file already
+    has the exact same content. The file is written to a temporary file in the
+    same directory and then atomically replaced. Returns `True` when the file
+    was written."""
+    data: bytes = content.encode("utf8") if isinstance(content, str) else content
+    try:
+        # We only hash the existing file when the size matches.
+        if os.stat(path).st_size == len(data) and (
+            digest(path) == hashlib.sha256(data).hexdigest()
+        ):
+            return False
+    except FileNotFoundError:
+        pass
+    with AtomicOutput(path) as f:
+        f.write(data)
+    return True
+
+
+class AtomicOutput:
+    """A context manager that yields a binary file to stream the output to.
+    The output is written to a temporary file in the same directory, which
+    atomically replaces the file at `path` on exit, unless both have the
+    exact same content. `written` tells if the file was replaced."""
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self.temp: Optional[str] = None
+        self.file: Optional[BinaryIO] = None
+        self.written: bool = False
+
+    def __enter__(self) -> BinaryIO:
+        parent = os.path.dirname(os.path.abspath(self.path))
+        fd, self.temp = tempfile.mkstemp(dir=parent, prefix=".", suffix=".tmp")
+        self.file = os.fdopen(fd, "wb")
+        return self.file
+
+    def __exit__(self, type, value, traceback):
+        assert self.file and self.temp
+        try:
+            self.file.close()
+            if value is None and not self.isSame():
+                os.chmod(self.temp, permissions(self.path))
+                os.replace(self.temp, self.path)
+                self.written = True
+        finally:
+            if os.path.exists(self.temp):
+                os.unlink(self.temp)
+
+    def isSame(self) -> bool:
+        """Tells if the temporary file has the same content as the output."""
+        assert self.temp
+        try:
+            return os.stat(self.path).st_size == os.stat(self.temp).st_size and (
+                digest(self.path) == digest(self.temp)
+            )
+        except FileNotFoundError:
+            return False
+
+
+def copy(path: str, out: BinaryIO) -> int:
+    """Copies the file at the given path to the binary file `out`, using
+    `sendfile` so that the data doesn't go through Python when `out` is
+    backed by a file descriptor. Returns the number of bytes copied."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        try:
+            fd = out.fileno()
+        except (AttributeError, OSError):
+            fd = None
+        if fd is not None and hasattr(os, "sendfile"):
+            out.flush()
+            offset: int = 0
+            try:
+                while offset < size:
+                    sent = os.sendfile(fd, f.fileno(), offset, size - offset)
+                    if not sent:
+                        break
+                    offset += sent
+                return offset
+            except OSError:
+                # Some outputs (like terminals on some platforms) don't
+                # support `sendfile`, we fall back to a regular copy.
+                f.seek(offset)
+                return offset + copychunks(f, out)
+        return copychunks(f, out)
+
+
+def copychunks(f: BinaryIO, out: BinaryIO) -> int:
+    """Copies the binary file `f` to `out` chunk by chunk."""
+    copied: int = 0
+    while chunk := f.read(CHUNK_SIZE):
+        out.write(chunk)
+        copied += len(chunk)
+    return copied
+
+
+# EOF
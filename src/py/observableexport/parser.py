@@ -1,19 +1,28 @@
 from .model import Notebook, Cell
+from .selector import Selector
 import re
 import json
-from typing import Optional
+from typing import Optional, Iterable
 
 # --
 # Notes
 # - JavaScript-exported notebooks contain the imported notebooks, which
 #   sometimes contain cells with the same names. These should not shadow
 #   the current notebook's cells.
+# - Cells are selected as soon as their header (name, origin, inputs) is
+#   parsed, so that the bodies of the cells excluded by the selector are
+#   never accumulated.
+# - The first module of an export is the notebook itself, the next ones are
+#   the notebooks it imports. When only the notebook itself is needed, the
+#   bodies of the cells of the imported modules are skipped.
 
 
 class NotebookParser:
     """A crude line-based cell extractor for Observable. This relies on the
     notebook exports to be formatted the same way, so it might need updates
-    along the way."""
+    along the way. Only the cells matching the `selector` are kept, and
+    with `skipsImported` the bodies of the cells of the imported modules are
+    skipped, leaving them empty."""
 
     # SEE: https://api.observablehq.com/@sebastien/boilerplate.js
     # NOTE: We use hardcoded spaces so that we don't match the body by accident.
@@ -29,7 +38,21 @@ class NotebookParser:
     END_VALUE = "    },"
     RE_INPUT_FUNCTION = re.compile(r"\(function\([^\)]*\)\{return\(")
 
-    def __init__(self):
+    def __init__(
+        self,
+        selector: Optional[Selector] = None,
+        skipsImported: bool = False,
+    ):
+        self.selector: Optional[Selector] = (
+            None if not selector or selector.isAll else selector
+        )
+        self.skipsImported: bool = skipsImported
+        # Tells if the body of the current cell is being skipped
+        self.isSkipping: bool = False
+        # The id of the first module (the notebook itself), the following
+        # ones being imported.
+        self.main: Optional[str] = None
+        self.isImported: bool = False
         self.feedLineToCell = False
         self.source: Optional[str] = None
         self.notebooks: dict[str, Notebook] = {}
@@ -41,12 +64,43 @@ class NotebookParser:
         self.metaRemote: Optional[str] = None
         # Tells if the cell is defined as a function
         self.isCellFunction = False
+        # Tells if the current cell is selected, `None` until the selector
+        # is applied.
+        self.isSelected: Optional[bool] = None
+
+    def addCell(self, name: Optional[str], type: Optional[str] = None) -> Cell:
+        """Adds a new cell to the current notebook, applying the selector to
+        the previous one first."""
+        assert self.notebook, f"Notebook not defined before cell definition"
+        self.select()
+        self.cell = self.notebook.addCell(
+            name,
+            source=self.metaFrom or self.source,
+            sourceName=self.metaRemote,
+            type=type,
+        )
+        self.isSelected = None
+        return self.cell
+
+    def select(self) -> bool:
+        """Applies the selector to the current cell (once), removing it
+        from its notebook when it is not selected."""
+        if self.isSelected is None and self.cell:
+            self.isSelected = not self.selector or self.selector(self.cell)
+            if not self.isSelected and self.notebook:
+                self.notebook.removeCell(self.cell)
+        return bool(self.isSelected)
 
     # FIXME: This should really be an event-driven parser `onXXX`. This is
     # super brittle.
     def feed(self, line: str):
         # DEBUG: Leaving this here as it's useful when we get parsing errors
         # print(f"PARSED| {repr(line)}")
+        if self.isSkipping:
+            # We're skipping the body of the cell, only looking for its end
+            if not line.startswith(self.END_FUNCTION):
+                return
+            self.isSkipping = False
         if not self.feedLineToCell and (match := self.NOTEBOOK.match(line)):
             # We have a new notebook, this sets the source of the cell
             # It can be :
@@ -54,7 +108,10 @@ class NotebookParser:
             # - @username/notebook@version
             # - NNNNNNNNNNNNNNN
             # - NNNNNNNNNNNNNNN@version
+            self.select()
             self.source = match.group("id") or match.group()
+            self.main = self.main or self.source
+            self.isImported = self.source != self.main
             self.feedLineToCell = False
             self.cell = None
             self.metaFrom = None
@@ -79,10 +136,7 @@ class NotebookParser:
             # by replacing spaces with underscore, which may triger some name
             # clashes.
             name = json.loads(line[len(self.NAME) : -2]).replace(" ", "_")
-            assert self.notebook, f"Notebook not defined before cell definition: {line}"
-            self.cell = self.notebook.addCell(
-                name, source=self.metaFrom or self.source, sourceName=self.metaRemote
-            )
+            self.addCell(name)
         elif line.startswith(self.FROM):
             # If we have a from, then it means the cell is imported from
             # another notebook.
@@ -105,43 +159,21 @@ class NotebookParser:
             # should be reworked.
             if not self.cell:
                 if inputs == ["md"]:
-                    self.cell = self.notebook.addCell(
-                        None,
-                        source=self.metaFrom or self.source,
-                        sourceName=self.metaRemote,
-                        type="md",
-                    )
-                    self.cell.inputs = [_ for _ in inputs if _ != "md"]
+                    self.addCell(None, type="md").inputs = []
                 elif inputs == ["html"]:
-                    self.cell = self.notebook.addCell(
-                        None,
-                        source=self.metaFrom or self.source,
-                        sourceName=self.metaRemote,
-                        type="html",
-                    )
-                    self.cell.inputs = [_ for _ in inputs if _ != "html"]
+                    self.addCell(None, type="html").inputs = []
                 else:
-                    self.cell = self.notebook.addCell(
-                        None,
-                        source=self.metaFrom or self.source,
-                        sourceName=self.metaRemote,
-                        type=None,
-                    )
-                    self.cell.inputs = inputs
+                    self.addCell(None).inputs = inputs
             elif self.cell:
                 # If we already have inputs, this means that we have a new cell,
                 # which is likely going to be anonymous
                 if self.cell.inputs:
-                    self.cell = self.notebook.addCell(
-                        None,
-                        source=self.metaFrom or self.source,
-                        sourceName=self.metaRemote,
-                        # FIXME: Why is this HTML?
-                        type="html",
-                    )
+                    # FIXME: Why is this HTML?
+                    self.addCell(None, type="html")
                 self.cell.inputs = inputs
         elif line.startswith(self.VALUE):
             rest = line[len(self.VALUE) :]
+            hasValue = False
             # Observable function declarations will start with
             # that prefix. This is a bit awkward, but besically we use
             # the `isCellFunction` flag to disambiguate between a cell
@@ -150,43 +182,66 @@ class NotebookParser:
                 self.isCellFunction = True
                 # If there's no cell defined, it means it's an anonymous cell
                 if not self.cell:
-                    assert self.notebook
-                    self.cell = self.notebook.addCell(
-                        None,
-                        source=self.metaFrom or self.source,
-                        sourceName=self.metaRemote,
-                    )
-
+                    self.addCell(None)
             elif self.cell:
-                self.cell.addLine(rest)
+                # The value is given inline, which ends the cell
+                if self.select():
+                    self.cell.addLine(rest)
                 self.isCellFunction = False
+                hasValue = True
             # NOTE: It's important to leave that at the end of the branch,
-            # as we may be creating cells.
-            self.feedLineToCell = self.cell and self.cell.isEmpty and True
+            # as we may be creating cells. The body of the cell follows, and
+            # is only accumulated when the cell is selected.
+            self.select()
+            self.feedLineToCell = bool(self.cell and not hasValue and self.cell.isEmpty)
+            self.isSkipping = (
+                self.feedLineToCell and self.skipsImported and self.isImported
+            )
         elif (self.isCellFunction and line.startswith(self.END_FUNCTION)) or (
             (not self.isCellFunction) and line.startswith(self.END_VALUE)
         ):
             # We've reached the end of a cell declaration, so we reset
             # our state.
             # TODO: I suspect we need to rewrite the VALUE/END to work in all cases
+            self.select()
             self.feedLineToCell = False
             self.cell = None
             self.metaFrom = None
             self.metaRemote = None
             self.isCellFunction = False
         elif self.feedLineToCell:
-            if self.cell:
+            if self.cell and self.select():
                 self.cell.addLine(line)
         else:
             # print("DEBUG")
             pass
 
 
-def parse(text: str) -> tuple[Optional[Notebook], dict[str, Notebook]]:
-    parser = NotebookParser()
+def parse(
+    text: str, selector: Optional[Selector] = None, skipsImported: bool = False
+) -> tuple[Optional[Notebook], dict[str, Notebook]]:
+    parser = NotebookParser(selector, skipsImported)
     for line in text.split("\n"):
         parser.feed(line + "\n")
+    parser.select()
     return parser.notebook, parser.notebooks
 
 
+def imports(lines: Iterable[str]) -> list[str]:
+    """Returns the sources of the notebooks imported by the notebook of the
+    given export lines, in order. Only the first module (the notebook itself)
+    is scanned, without parsing its cells."""
+    res: list[str] = []
+    modules: int = 0
+    for line in lines:
+        if NotebookParser.NOTEBOOK.match(line):
+            if (modules := modules + 1) > 1:
+                break
+        elif line.startswith(NotebookParser.FROM):
+            source = json.loads(line[len(NotebookParser.FROM) :].rstrip().rstrip(","))
+            if source not in res:
+                res.append(source)
+    return res
+
+
 # EOF
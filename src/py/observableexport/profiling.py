@@ -0,0 +1,192 @@
+from typing import Optional, Iterator, Callable, TypeVar, Any, cast
+from functools import wraps
+from inspect import isgeneratorfunction
+import threading
+import time
+import json
+
+__doc__ = """
+Lightweight instrumentation spans for the hot paths of the exporter (network,
+parsing, normalisation and rendering). Spans are aggregated per phase, and
+cost a single attribute check when the profiler is disabled.
+"""
+
+T = TypeVar("T")
+
+
+class Phase:
+    """Aggregated statistics for a named phase."""
+
+    __slots__ = ("name", "calls", "time", "bytes")
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.calls: int = 0
+        self.time: float = 0.0
+        self.bytes: int = 0
+
+    def asDict(self) -> dict:
+        return dict(calls=self.calls, time=self.time, bytes=self.bytes)
+
+
+class Span:
+    """An active measurement, use `add` to account for processed bytes."""
+
+    __slots__ = ("profiler", "name", "started", "bytes")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name: str = name
+        self.started: float = 0.0
+        self.bytes: int = 0
+
+    def add(self, count: int) -> "Span":
+        self.bytes += count
+        return self
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(
+            self.name, time.perf_counter() - self.started, self.bytes
+        )
+
+
+class NullSpan:
+    """The span returned when the profiler is disabled, it does nothing."""
+
+    __slots__ = ()
+
+    def add(self, count: int) -> "NullSpan":
+        return self
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Profiler:
+    """Aggregates spans by phase name. The profiler is disabled by default,
+    in which case `span` returns a shared no-op span."""
+
+    def __init__(self):
+        self.enabled: bool = False
+        self.started: Optional[float] = None
+        self.phases: dict[str, Phase] = {}
+        self.lock = threading.Lock()
+
+    def enable(self) -> "Profiler":
+        self.enabled = True
+        self.started = time.perf_counter()
+        return self
+
+    def disable(self) -> "Profiler":
+        self.enabled = False
+        return self
+
+    def reset(self) -> "Profiler":
+        with self.lock:
+            self.phases = {}
+        self.started = time.perf_counter() if self.enabled else None
+        return self
+
+    def record(self, name: str, elapsed: float, count: int = 0):
+        with self.lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = Phase(name)
+            phase.calls += 1
+            phase.time += elapsed
+            phase.bytes += count
+
+    def span(self, name: str):
+        """Returns a context manager measuring the wrapped block."""
+        return Span(self, name) if self.enabled else NULL_SPAN
+
+    def timed(self, name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """Decorates a function so that its calls are measured. Generator
+        functions are measured through `iterated`."""
+
+        def decorator(f: Callable[..., T]) -> Callable[..., T]:
+            if isgeneratorfunction(f):
+
+                @wraps(f)
+                def generator(*args, **kwargs):
+                    return self.iterated(name, f(*args, **kwargs))
+
+                return cast(Callable[..., T], generator)
+
+            @wraps(f)
+            def wrapper(*args, **kwargs) -> T:
+                if not self.enabled:
+                    return f(*args, **kwargs)
+                with Span(self, name):
+                    return f(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def iterated(self, name: str, iterator: Iterator[str]) -> Iterator[str]:
+        """Measures the time spent producing the items of the given iterator,
+        excluding the time spent by the consumer, and counts the characters
+        yielded."""
+        return self._iterated(name, iterator) if self.enabled else iterator
+
+    def _iterated(self, name: str, iterator: Iterator[str]) -> Iterator[str]:
+        elapsed: float = 0.0
+        count: int = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                break
+            elapsed += time.perf_counter() - started
+            count += len(item)
+            yield item
+        self.record(name, elapsed, count)
+
+    def report(self) -> dict[str, Any]:
+        """Returns the report as a JSON-serialisable dictionary"""
+        with self.lock:
+            phases = {k: v.asDict() for k, v in sorted(self.phases.items())}
+        return dict(
+            wall=(time.perf_counter() - self.started) if self.started else 0.0,
+            phases=phases,
+        )
+
+    def dump(self, path: str):
+        """Writes the report as JSON to the given path."""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+
+# --
+# ## High-Level API
+
+PROFILER = Profiler()
+
+
+def span(name: str):
+    return PROFILER.span(name)
+
+
+def timed(name: str):
+    return PROFILER.timed(name)
+
+
+def iterated(name: str, iterator: Iterator[str]) -> Iterator[str]:
+    return PROFILER.iterated(name, iterator)
+
+
+# EOF
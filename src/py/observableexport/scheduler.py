@@ -0,0 +1,232 @@
+from .metrics import Metrics
+from typing import Optional, Iterator, Callable, TypeVar, Any
+from contextlib import contextmanager
+import threading
+import time
+
+__doc__ = """
+Schedules the requests sent to the Observable API so that they stay within
+its rate limits: a token bucket caps the request rate, `Retry-After` is
+honoured on HTTP 429/503, and the concurrency adapts, halving when the API
+throttles us and growing back as requests succeed.
+"""
+
+T = TypeVar("T")
+
+# The status codes that tell us to slow down
+THROTTLED = (429, 503)
+
+
+class TokenBucket:
+    """A thread-safe token bucket, refilled at `rate` tokens per second up
+    to `burst` tokens."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate: float = rate
+        self.burst: float = burst or max(1.0, rate)
+        self.tokens: float = self.burst
+        self.updated: float = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Blocks until the given number of tokens are available"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class Scheduler:
+    """Runs requests within a rate limit and an adaptive concurrency limit,
+    retrying throttled requests. The concurrency limit is halved on each
+    throttled response, and increased by one after `limit` consecutive
+    successes (additive increase, multiplicative decrease)."""
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        concurrency: int = 8,
+        minConcurrency: int = 1,
+        retries: int = 5,
+        backoff: float = 1.0,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.bucket: Optional[TokenBucket] = TokenBucket(rate) if rate else None
+        self.maxConcurrency: int = concurrency
+        self.minConcurrency: int = minConcurrency
+        self.limit: int = concurrency
+        self.active: int = 0
+        self.successes: int = 0
+        self.retries: int = retries
+        self.backoff: float = backoff
+        # Requests are paused until that time, as told by `Retry-After`
+        self.pausedUntil: float = 0.0
+        self.metrics: Metrics = metrics or Metrics()
+        self.condition = threading.Condition()
+
+    def configure(
+        self, rate: Optional[float] = None, concurrency: Optional[int] = None
+    ) -> "Scheduler":
+        """Updates the rate and maximum concurrency."""
+        if rate is not None:
+            self.bucket = TokenBucket(rate) if rate > 0 else None
+        if concurrency is not None:
+            with self.condition:
+                self.maxConcurrency = max(self.minConcurrency, concurrency)
+                self.limit = self.maxConcurrency
+                self.condition.notify_all()
+        return self
+
+    def run(self, send: Callable[[], T]) -> T:
+        """Runs `send`, which returns a response with a `status_code` and
+        `headers`, retrying it when the response is throttled. The last
+        response is returned when retries are exhausted. The concurrency
+        slot is released as soon as `send` returns, see `running` for
+        streamed responses."""
+        with self.running(send) as response:
+            return response
+
+    @contextmanager
+    def running(self, send: Callable[[], T]) -> Iterator[T]:
+        """Like `run`, but holds the concurrency slot until the context
+        exits, so that the bodies of streamed responses are downloaded
+        within the concurrency limit."""
+        attempt: int = 0
+        while True:
+            self.acquire()
+            try:
+                response: Any = send()
+            except BaseException:
+                self.release()
+                raise
+            if response.status_code not in THROTTLED:
+                self.onSuccess()
+                try:
+                    yield response
+                finally:
+                    self.release()
+                return
+            self.release()
+            self.onThrottled(response)
+            if attempt >= self.retries:
+                yield response
+                return
+            # Streamed responses hold their connection until closed
+            if close := getattr(response, "close", None):
+                close()
+            attempt += 1
+            self.metrics.inc("retries")
+            delay = self.retryAfter(response)
+            self.pause(
+                delay if delay is not None else self.backoff * (2 ** (attempt - 1))
+            )
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+        delay = self.pausedUntil - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if self.bucket:
+            self.bucket.acquire()
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def pause(self, delay: float):
+        """Pauses all requests for the given delay, in seconds"""
+        with self.condition:
+            self.pausedUntil = max(self.pausedUntil, time.monotonic() + delay)
+        time.sleep(max(0.0, self.pausedUntil - time.monotonic()))
+
+    def onSuccess(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.maxConcurrency:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify()
+
+    def onThrottled(self, response: Any):
+        self.metrics.inc(f"throttled.{response.status_code}")
+        with self.condition:
+            self.limit = max(self.minConcurrency, self.limit // 2)
+            self.successes = 0
+
+    @staticmethod
+    def retryAfter(response: Any) -> Optional[float]:
+        """Returns the delay in seconds given by the `Retry-After` header of
+        the response, which is either a number of seconds or an HTTP date."""
+        value = (response.headers or {}).get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        from email.utils import parsedate_to_datetime
+
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class Flight:
+    """An in-flight call, shared by all the callers with the same key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key, so that only the first
+    caller runs the call and the others wait for and share its result (or
+    its error)."""
+
+    def __init__(self, metrics: Optional[Metrics] = None):
+        self.flights: dict[str, Flight] = {}
+        self.metrics: Metrics = metrics or Metrics()
+        self.lock = threading.Lock()
+
+    def run(self, key: str, call: Callable[[], T]) -> T:
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            self.metrics.inc("coalesced")
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = call()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+
+# EOF
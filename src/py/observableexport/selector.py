@@ -0,0 +1,96 @@
+from .model import Notebook, Cell
+from typing import Optional, Iterable, Callable
+from fnmatch import translate
+import re
+
+__doc__ = """
+Selectors pick the cells of a notebook by name (include and exclude glob
+patterns), type, origin and whether they are named. The criteria are
+compiled once into a single predicate, which the parser applies as it goes
+so that the bodies of excluded cells are never accumulated.
+"""
+
+
+def globs(patterns: Iterable[str]) -> Optional[re.Pattern]:
+    """Compiles the given glob patterns into a single regular expression
+    matching any of them, or `None` when there are no patterns."""
+    patterns = [_ for _ in patterns if _]
+    return re.compile("|".join(translate(_) for _ in patterns)) if patterns else None
+
+
+class Selector:
+    """Selects the cells that match any of the `include` patterns (all cells
+    when there are none) and none of the `exclude` patterns, that have one
+    of the given `types`, come from one of the given `sources` (glob
+    patterns on the notebook the cell comes from) and, if `isNamed`, that
+    are not anonymous."""
+
+    def __init__(
+        self,
+        include: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        types: Iterable[str] = (),
+        sources: Iterable[str] = (),
+        isNamed: bool = False,
+    ):
+        self.include: Optional[re.Pattern] = globs(include)
+        self.exclude: Optional[re.Pattern] = globs(exclude)
+        self.types: frozenset[str] = frozenset(types)
+        self.sources: Optional[re.Pattern] = globs(sources)
+        self.isNamed: bool = isNamed
+        self.predicate: Callable[[Cell], bool] = self.compile()
+
+    @property
+    def isAll(self) -> bool:
+        """Tells if the selector selects every cell"""
+        return not (
+            self.include or self.exclude or self.types or self.sources or self.isNamed
+        )
+
+    def compile(self) -> Callable[[Cell], bool]:
+        """Returns the predicate testing all the criteria of the selector,
+        which only includes the tests for the criteria that are set."""
+        tests: list[Callable[[Cell], bool]] = []
+        if self.isNamed:
+            tests.append(lambda _: not _.isAnonymous)
+        if self.types:
+            types = self.types
+            tests.append(lambda _: _.type in types)
+        if include := self.include:
+            tests.append(lambda _: bool(include.match(_.name)))
+        if exclude := self.exclude:
+            tests.append(lambda _: not exclude.match(_.name))
+        if sources := self.sources:
+            tests.append(lambda _: bool(sources.match(_.source or "")))
+        if not tests:
+            return lambda _: True
+        elif len(tests) == 1:
+            return tests[0]
+        else:
+            return lambda cell: all(_(cell) for _ in tests)
+
+    def select(self, notebook: Notebook) -> Notebook:
+        """Returns a new notebook with the selected cells of the given
+        (already parsed) notebook."""
+        return (
+            notebook
+            if self.isAll
+            else Notebook(
+                id=notebook.id, cells=[_ for _ in notebook.cells if self.predicate(_)]
+            )
+        )
+
+    def __call__(self, cell: Cell) -> bool:
+        return self.predicate(cell)
+
+    # NOTE: Selectors are sent to the bulk export workers, and the compiled
+    # predicate can't be pickled, so it's compiled again.
+    def __getstate__(self) -> dict:
+        return {k: v for k, v in self.__dict__.items() if k != "predicate"}
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.predicate = self.compile()
+
+
+# EOF
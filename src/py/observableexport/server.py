@@ -0,0 +1,200 @@
+from .model import Notebook, NotebookRef
+from .bulk import Renderer, Rendered
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, unquote
+import sys
+import threading
+import time
+
+__doc__ = """
+A long-running export server, answering `/@user/name@version.js` (and
+`.md`, `.json`, as well as `/<id>@<version>.js` and `/d/<id>@<version>.js`)
+with exports rendered on demand. Parsed notebooks and rendered exports are
+kept warm, concurrent requests for the same export are rendered once, and
+requests are handled by a pool of threads.
+"""
+
+# The content type of each of the supported formats
+FORMATS: dict[str, str] = {
+    "js": "application/javascript; charset=utf-8",
+    "md": "text/markdown; charset=utf-8",
+    "json": "application/json; charset=utf-8",
+}
+# The time (in seconds) after which idle connections are closed
+TIMEOUT = 30.0
+
+
+class Exports:
+    """Resolves the export requests to the exports rendered (and kept warm)
+    by a `Renderer`. Unversioned names are resolved again to their latest
+    version after `ttl` seconds."""
+
+    def __init__(
+        self,
+        key: Optional[str] = None,
+        ttl: float = 60.0,
+        **options,
+    ):
+        self.renderer: Renderer = Renderer(key, **options)
+        self.api = self.renderer.api
+        self.key: Optional[str] = key
+        self.ttl: float = ttl
+        # The time at which unversioned names were resolved, guarded by
+        # `lock` as requests are handled by concurrent threads.
+        self.resolvedAt: dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, path: str) -> Optional[tuple[NotebookRef, str, bool]]:
+        """Resolves the given request path to a notebook reference and a
+        format, telling if the reference is a pinned version."""
+        path = unquote(urlsplit(path).path).lstrip("/")
+        if "." not in path:
+            return None
+        notebook, format = path.rsplit(".", 1)
+        # Imports are relative to the importing notebook, so notebook ids
+        # can be prefixed by `d/` or by the path of a public notebook.
+        if Notebook.IsPrivate(notebook.rsplit("/", 1)[-1]):
+            notebook = notebook.rsplit("/", 1)[-1]
+        name = Notebook.ParseName(notebook)
+        if format not in FORMATS or not name:
+            return None
+        isPinned = name.rev is not None
+        if not isPinned:
+            # The name is forgotten by a single thread once its resolution
+            # is stale, the others reuse the new one.
+            with self.lock:
+                resolved = self.resolvedAt.get(notebook)
+                now = time.monotonic()
+                if resolved is None or now - resolved > self.ttl:
+                    self.api.forget(notebook, self.key)
+                    self.resolvedAt[notebook] = now
+        return self.api.resolve(notebook, self.key), format, isPinned
+
+    def get(self, path: str) -> Optional[tuple[Rendered, str, bool]]:
+        """Returns the export for the given request path, its format and
+        whether it is a pinned version. The export is rendered when it's
+        not warm yet."""
+        resolved = self.resolve(path)
+        if not resolved:
+            return None
+        ref, format, isPinned = resolved
+        return self.renderer.render(ref, format), format, isPinned
+
+
+class ExportHandler(BaseHTTPRequestHandler):
+    """Answers the export requests of an `ExportServer`."""
+
+    # We support persistent connections, as we always send the length, and
+    # close them when idle so that they don't hold the threads of the pool.
+    protocol_version = "HTTP/1.1"
+    timeout = TIMEOUT
+    server: "ExportServer"
+
+    def do_HEAD(self):
+        self.answer(withBody=False)
+
+    def do_GET(self):
+        self.answer(withBody=True)
+
+    def answer(self, withBody: bool):
+        try:
+            found = self.server.exports.get(self.path)
+        except (RuntimeError, ValueError) as e:
+            return self.fail(502, str(e), withBody)
+        except Exception as e:
+            self.log_error("Export failed: %s: %r", self.path, e)
+            return self.fail(500, f"Export failed: {self.path}", withBody)
+        if not found:
+            return self.fail(404, f"Not found: {self.path}", withBody)
+        rendered, format, isPinned = found
+        etag = f'"{rendered.digest}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", FORMATS[format])
+        self.send_header("Content-Length", str(len(rendered.body)))
+        self.send_header("ETag", etag)
+        self.send_header(
+            "Cache-Control",
+            "public, max-age=31536000, immutable"
+            if isPinned
+            else f"public, max-age={int(self.server.exports.ttl)}",
+        )
+        self.end_headers()
+        if withBody:
+            self.wfile.write(rendered.body)
+
+    def fail(self, status: int, message: str, withBody: bool):
+        body = f"{message}\n".encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if withBody:
+            self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        if not self.server.isQuiet:
+            super().log_message(format, *args)
+
+
+class ExportServer(HTTPServer):
+    """An HTTP server answering export requests with a pool of threads."""
+
+    def __init__(
+        self,
+        exports: Exports,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        threads: int = 32,
+        isQuiet: bool = False,
+    ):
+        super().__init__((host, port), ExportHandler)
+        self.exports: Exports = exports
+        self.isQuiet: bool = isQuiet
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.processRequest, request, client_address)
+
+    def processRequest(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    key: Optional[str] = None,
+    threads: int = 32,
+    ttl: float = 60.0,
+    isQuiet: bool = False,
+    **options,
+):
+    """Serves the exports of notebooks until interrupted."""
+    server = ExportServer(Exports(key, ttl, **options), host, port, threads, isQuiet)
+    sys.stderr.write(f"--- Serving exports on http://{host}:{server.server_port}\n")
+    sys.stderr.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# EOF
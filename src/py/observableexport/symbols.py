@@ -0,0 +1,198 @@
+from .model import Notebook, NotebookRef
+from typing import Optional, NamedTuple, Iterable
+import sqlite3
+import os
+
+__doc__ = """
+An on-disk index of the symbols (cell names) defined and imported by a
+corpus of notebooks, so that we can find which notebook defines a given
+symbol without going through the raw exports. The index is stored as an
+SQLite database, and is updated incrementally as notebook versions change.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notebooks (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    username TEXT,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    symbol TEXT NOT NULL,
+    notebook TEXT NOT NULL,
+    cell TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    source TEXT,
+    PRIMARY KEY (symbol, notebook, kind)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS symbols_notebook ON symbols (notebook);
+"""
+
+# The kind of symbols
+DEFINED = "defined"
+IMPORTED = "imported"
+
+
+class Symbol(NamedTuple):
+    """A symbol defined or imported by a notebook cell. For imported
+    symbols, the `cell` is the name of the cell in the `source` notebook."""
+
+    symbol: str
+    id: str
+    version: int
+    cell: str
+    kind: str
+    source: Optional[str] = None
+
+
+class SymbolIndex:
+    """Maps symbols to the notebooks and cells that define or import them."""
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def version(self, id: str) -> Optional[int]:
+        """Returns the indexed version of the notebook with the given id"""
+        row = self.db.execute(
+            "SELECT version FROM notebooks WHERE id = ?", (id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def has(self, ref: NotebookRef) -> bool:
+        """Tells if the given notebook version is already indexed"""
+        return self.version(ref.id) == ref.version
+
+    def add(self, ref: NotebookRef, notebook: Notebook) -> bool:
+        """Indexes the symbols of the given notebook, replacing the symbols of
+        any previously indexed version. Returns `False` when this version is
+        already indexed."""
+        if self.has(ref):
+            return False
+        rows: dict[tuple[str, str], tuple] = {}
+        for cell in notebook.cells:
+            if cell.isAnonymous:
+                continue
+            elif cell.source in (None, notebook.id):
+                rows[(cell.name, DEFINED)] = (
+                    cell.name,
+                    ref.id,
+                    cell.name,
+                    DEFINED,
+                    None,
+                )
+            else:
+                rows.setdefault(
+                    (cell.name, IMPORTED),
+                    (
+                        cell.name,
+                        ref.id,
+                        cell.sourceName or cell.name,
+                        IMPORTED,
+                        cell.source,
+                    ),
+                )
+        with self.db:
+            self.db.execute("DELETE FROM symbols WHERE notebook = ?", (ref.id,))
+            self.db.execute(
+                "INSERT OR REPLACE INTO notebooks VALUES (?, ?, ?, ?)",
+                (ref.id, ref.version, ref.username, ref.name),
+            )
+            self.db.executemany(
+                "INSERT INTO symbols VALUES (?, ?, ?, ?, ?)", rows.values()
+            )
+        return True
+
+    def remove(self, id: str) -> "SymbolIndex":
+        """Removes the notebook with the given id from the index"""
+        with self.db:
+            self.db.execute("DELETE FROM symbols WHERE notebook = ?", (id,))
+            self.db.execute("DELETE FROM notebooks WHERE id = ?", (id,))
+        return self
+
+    def lookup(self, symbol: str, kind: Optional[str] = None) -> list[Symbol]:
+        """Returns the notebooks defining (or importing) the given symbol"""
+        query = (
+            "SELECT s.symbol, s.notebook, n.version, s.cell, s.kind, s.source"
+            " FROM symbols s JOIN notebooks n ON s.notebook = n.id"
+            " WHERE s.symbol = ?"
+        )
+        return [
+            Symbol(*_)
+            for _ in self.db.execute(
+                query + (" AND s.kind = ?" if kind else "") + " ORDER BY s.kind",
+                (symbol, kind) if kind else (symbol,),
+            )
+        ]
+
+    def notebooks(self) -> list[NotebookRef]:
+        """Returns the indexed notebooks"""
+        return [
+            NotebookRef(id=id, version=version, username=username, name=name)
+            for id, version, username, name in self.db.execute(
+                "SELECT id, version, username, name FROM notebooks ORDER BY id"
+            )
+        ]
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self) -> "SymbolIndex":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def symbols_index(
+    index: SymbolIndex,
+    notebooks: Iterable[str],
+    key: Optional[str] = None,
+    withDependencies: bool = False,
+) -> tuple[int, int]:
+    """Indexes the given notebooks, which can be names, ids or local raw
+    exports, optionally crawling their dependencies. Returns the number of
+    notebooks indexed and skipped (already indexed at the same version)."""
+    from .api import NotebookAPI
+
+    api = NotebookAPI.Get()
+    indexed: int = 0
+    skipped: int = 0
+    refs: list[NotebookRef] = []
+    for name in notebooks:
+        if os.path.isfile(name):
+            notebook = api.parseFile(name)
+            ref = notebook_ref(notebook) if notebook else None
+            if not notebook or not ref:
+                raise RuntimeError(f"Could not parse notebook: {name}")
+            if index.add(ref, notebook):
+                indexed += 1
+            else:
+                skipped += 1
+        else:
+            refs.append(api.resolve(name, key))
+    if withDependencies and refs:
+        refs = api.dependencies(*refs, key=key)
+    for ref in refs:
+        if index.has(ref):
+            skipped += 1
+            continue
+        notebook = api.load(ref, key)
+        if not notebook:
+            raise RuntimeError(f"Could not load notebook: {ref.key}")
+        index.add(ref, notebook)
+        indexed += 1
+    return indexed, skipped
+
+
+def notebook_ref(notebook: Notebook) -> Optional[NotebookRef]:
+    """Returns the reference of a parsed notebook, based on its id, which
+    is expected to be like `<id>@<version>`."""
+    name = Notebook.ParseName(notebook.id or "")
+    if not name or not name.id or name.rev is None:
+        return None
+    return NotebookRef(id=name.id, version=int(name.rev))
+
+
+# EOF
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+__doc__ = """
+Measures the cold start of the `observable-export` CLI, using
+`python -X importtime` to break down the import cost and timing the
+`--help` command end to end. Heavy modules (`requests`, `graphlib`) should
+not be loaded on these code paths.
+"""
+
+BASE = Path(__file__).parent.parent
+ENV = dict(os.environ, PYTHONPATH=str(BASE / "src" / "py"))
+RE_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$")
+HEAVY_MODULES = ("requests", "urllib3", "charset_normalizer", "graphlib")
+RUNS = int(os.getenv("RUNS", "20"))
+
+
+def importtime(module: str) -> dict[str, int]:
+    """Returns the cumulative import time (in µs) of the top-level modules
+    imported when importing `module`."""
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=ENV,
+        capture_output=True,
+        text=True,
+    )
+    times: dict[str, int] = {}
+    for line in res.stderr.split("\n"):
+        if match := RE_IMPORTTIME.match(line):
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def walltime(*args: str, runs: int = RUNS) -> float:
+    """Returns the best wall time (in seconds) of running the CLI with the
+    given arguments."""
+    best: float = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "observableexport", *args],
+            env=ENV,
+            capture_output=True,
+        )
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+if __name__ == "__main__":
+    times = importtime("observableexport.command")
+    heavy = [_ for _ in times if _.split(".")[0] in HEAVY_MODULES]
+    print(f"import observableexport.command: {times.get('observableexport.command', 0)}µs")
+    for name, value in sorted(times.items(), key=lambda _: -_[1])[:10]:
+        print(f"  {value:>8}µs {name}")
+    print(f"observable-export --help: {walltime('--help') * 1000:.1f}ms (best of {RUNS})")
+    if heavy:
+        print(f"!!! Heavy modules loaded at startup: {', '.join(heavy)}")
+        sys.exit(1)
+
+# EOF
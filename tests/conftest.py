@@ -0,0 +1,118 @@
+import sys
+import json
+from pathlib import Path
+from typing import Iterator, Callable, Optional
+import pytest
+
+BASE = Path(__file__).parent
+sys.path.insert(0, str(BASE.parent / "src" / "py"))
+
+from observableexport.api import ObservableAPI, NotebookAPI  # noqa: E402
+from observableexport.cache import MemoryCache, CHUNK_SIZE  # noqa: E402
+
+__doc__ = """
+Shared fixtures. The tests never hit the network: the Observable API is
+replaced by `FakeObservableAPI`, which serves canned responses by path.
+"""
+
+RAW = (BASE / "data-notebook-raw.js").read_text()
+PROBLEMATIC = (BASE / "data-notebook-raw-problematic.js").read_text()
+
+
+def document(username: str, name: str, id: str, version: int) -> str:
+    return json.dumps(
+        dict(
+            id=id,
+            latest_version=version,
+            slug=name,
+            owner=dict(login=username),
+        )
+    )
+
+
+# The published notebooks of the fixtures: `@sebastien/apidoc` imports
+# `@sebastien/boilerplate`.
+ROUTES: dict[str, str] = {
+    "document/@sebastien/boilerplate": document(
+        "sebastien", "boilerplate", "28e219d819b6b627", 2228
+    ),
+    "document/@sebastien/apidoc": document(
+        "sebastien", "apidoc", "8ed172ec5b1d17d2", 230
+    ),
+    "@sebastien/boilerplate@2228.js": RAW,
+    "@sebastien/apidoc@230.js": PROBLEMATIC,
+}
+
+
+class FakeResponse:
+    """A streamed `requests` response, as used by `ObservableAPI`."""
+
+    def __init__(self, status_code: int, body: bytes, headers: dict[str, str]):
+        self.status_code: int = status_code
+        self.body: bytes = body
+        self.headers: dict[str, str] = headers
+        self.raw = None
+        self.isClosed: bool = False
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf8")
+
+    def iter_content(self, size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        for i in range(0, len(self.body), size):
+            yield self.body[i : i + size]
+
+    def close(self):
+        self.isClosed = True
+
+    def __enter__(self) -> "FakeResponse":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeObservableAPI(ObservableAPI):
+    """Serves the responses of the given routes (paths relative to the API
+    root) instead of sending requests, recording the requested paths. The
+    `statuses` of a path are answered first, like `429` to throttle it."""
+
+    def __init__(self, routes: dict[str, str]):
+        super().__init__()
+        self.cache = MemoryCache()
+        self.routes: dict[str, str] = routes
+        self.statuses: dict[str, list[int]] = {}
+        self.requests: list[str] = []
+        self.responses: list[FakeResponse] = []
+
+    def send(self, url: str, headers: dict[str, str]) -> FakeResponse:
+        path = url.split("api.observablehq.com/", 1)[-1]
+        self.requests.append(path)
+        if statuses := self.statuses.get(path):
+            response = FakeResponse(statuses.pop(0), b"", {"Retry-After": "0"})
+        elif path not in self.routes:
+            response = FakeResponse(404, b"not found", {})
+        else:
+            response = FakeResponse(200, self.routes[path].encode("utf8"), {})
+        self.responses.append(response)
+        return response
+
+
+@pytest.fixture
+def observable(monkeypatch) -> Callable[..., NotebookAPI]:
+    """Returns a function that installs a `NotebookAPI` singleton backed by
+    a `FakeObservableAPI` serving the given routes (`ROUTES` by default)."""
+    monkeypatch.delenv("OBSERVABLE_CACHE", raising=False)
+    monkeypatch.delenv("OBSERVABLE_API_KEY", raising=False)
+
+    def install(routes: Optional[dict[str, str]] = None) -> NotebookAPI:
+        api = FakeObservableAPI(dict(ROUTES) if routes is None else routes)
+        notebooks = NotebookAPI(api)
+        monkeypatch.setattr(ObservableAPI, "Instance", api)
+        monkeypatch.setattr(NotebookAPI, "Instance", notebooks)
+        return notebooks
+
+    return install
+
+
+# EOF
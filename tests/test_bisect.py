@@ -0,0 +1,64 @@
+from conftest import RAW, document
+from observableexport.diff import notebook_bisect, Revision, ADDED, MODIFIED
+
+LATEST = 20
+# The `str` cell is modified at version 13, and `extra` is added at version 7
+MODIFIED_AT = 13
+ADDED_AT = 7
+EXTRA = '''    {
+      name: "extra",
+      value: (function(){return(
+1
+)})
+    },
+'''
+
+
+def version(n: int) -> str:
+    text = RAW.replace("28e219d819b6b627@2228", f"28e219d819b6b627@{n}")
+    if n >= MODIFIED_AT:
+        text = text.replace('_ => "" + _', "_ => String(_)")
+    if n >= ADDED_AT:
+        text = text.replace("  variables: [\n", "  variables: [\n" + EXTRA, 1)
+    return text
+
+
+def routes() -> dict[str, str]:
+    res = {
+        "document/@sebastien/boilerplate": document(
+            "sebastien", "boilerplate", "28e219d819b6b627", LATEST
+        )
+    }
+    for n in range(1, LATEST + 1):
+        res[f"@sebastien/boilerplate@{n}.js"] = version(n)
+    return res
+
+
+def test_bisect_modified(observable):
+    notebooks = observable(routes())
+    assert notebook_bisect("@sebastien/boilerplate", "str") == Revision(
+        "str", MODIFIED_AT, MODIFIED_AT - 1, MODIFIED
+    )
+    # Only some of the versions are loaded
+    assert len(notebooks.api.requests) < LATEST
+
+
+def test_bisect_added(observable):
+    observable(routes())
+    for jobs in (1, 3):
+        assert notebook_bisect(
+            "@sebastien/boilerplate", "extra", jobs=jobs
+        ) == Revision("extra", ADDED_AT, ADDED_AT - 1, ADDED)
+
+
+def test_bisect_range(observable):
+    observable(routes())
+    # The state at the `upper` version is the one looked for
+    assert notebook_bisect("@sebastien/boilerplate", "str", upper=10) is None
+    assert notebook_bisect("@sebastien/boilerplate", "bool") is None
+    assert notebook_bisect(
+        "@sebastien/boilerplate", "str", lower=MODIFIED_AT - 1, upper=MODIFIED_AT
+    ) == Revision("str", MODIFIED_AT, MODIFIED_AT - 1, MODIFIED)
+
+
+# EOF
@@ -0,0 +1,139 @@
+import os
+import json
+from conftest import BASE, RAW as RAW_TEXT
+from observableexport.bulk import (
+    export_bulk,
+    export_graph,
+    export_many,
+    context,
+    Renderer,
+)
+from observableexport.selector import Selector
+
+RAW = str(BASE / "data-notebook-raw.js")
+
+
+def test_workers_are_not_forked():
+    assert context().get_start_method() != "fork"
+
+
+def test_export_bulk_local(tmp_path):
+    (result,) = export_bulk([RAW], str(tmp_path), format="js", jobs=1)
+    assert not result.error and result.written
+    assert result.path == str(tmp_path / "data-notebook-raw.js")
+    assert "export const html" in (tmp_path / "data-notebook-raw.js").read_text()
+    # The file is left as it is when its content didn't change
+    (result,) = export_bulk([RAW], str(tmp_path), format="js", jobs=1)
+    assert not result.error and not result.written
+
+
+def test_export_bulk_selection(tmp_path):
+    (result,) = export_bulk(
+        [RAW],
+        str(tmp_path),
+        format="js",
+        jobs=1,
+        selector=Selector(exclude=["style*"]),
+        entries=["html"],
+    )
+    assert not result.error
+    text = (tmp_path / "data-notebook-raw.js").read_text()
+    assert "export const html" in text
+    assert "export const dom" in text
+    assert "export const stylesheet" not in text
+    assert "export const map " not in text
+
+
+
+def test_export_bulk_imports(observable, tmp_path):
+    """The workers don't use the API (they don't have the fake one), so the
+    imported notebooks are resolved and fetched by the parent process."""
+    api = observable()
+    (result,) = export_bulk(["@sebastien/apidoc"], str(tmp_path), jobs=1)
+    assert not result.error
+    text = (tmp_path / "8ed172ec5b1d17d2@230.js").read_text()
+    assert "from './28e219d819b6b627@2228.js'" in text
+    # Only bundles need the exports of the dependencies
+    assert "@sebastien/boilerplate@2228.js" not in api.api.requests
+    (result,) = export_bulk(
+        ["@sebastien/apidoc"], str(tmp_path), format="bundle", jobs=1
+    )
+    assert not result.error
+    text = (tmp_path / "8ed172ec5b1d17d2@230.js").read_text()
+    assert "// @notebook('28e219d819b6b627@2228')" in text
+    assert "const {html, map, dom, stylesheet} = __28e219d819b6b627_2228;" in text
+    assert "@sebastien/boilerplate@2228.js" in api.api.requests
+
+
+def test_export_bulk_errors(observable, tmp_path):
+    observable()
+    results = list(
+        export_bulk(["@sebastien/missing", RAW], str(tmp_path), format="md", jobs=1)
+    )
+    assert len(results) == 2
+    (failed,) = [_ for _ in results if _.error]
+    assert failed.notebook == "@sebastien/missing" and "404" in failed.error
+
+
+def test_export_many(observable):
+    api = observable()
+    notebooks = ["@sebastien/boilerplate", "@sebastien/apidoc", "@sebastien/missing"]
+    futures = export_many(notebooks, ["js", "md", "json"], max_workers=4)
+    results = [_.result() for _ in futures]
+    # There is one result per notebook and format, in order
+    assert [(_.notebook, _.format) for _ in results] == [
+        (n, f) for n in notebooks for f in ("js", "md", "json")
+    ]
+    failed = [_ for _ in results if _.error]
+    assert [_.notebook for _ in failed] == ["@sebastien/missing"] * 3
+    assert all(_.text is None for _ in failed)
+    js, md, data = results[:3]
+    assert js.ref and js.ref.key == "28e219d819b6b627@2228"
+    assert js.text and "export const html" in js.text
+    assert md.text and md.text.startswith("# Boilerplate")
+    assert data.text and "html" in json.loads(data.text)
+    # Each notebook is fetched and parsed once, whatever the formats
+    for url in ("@sebastien/boilerplate@2228.js", "@sebastien/apidoc@230.js"):
+        assert api.api.requests.count(url) == 1
+    assert api.metrics.get("cache.parsed.misses") == 2
+
+
+def test_export_many_shared_renderer(observable):
+    observable()
+    renderer = Renderer()
+    (first,) = export_many(["@sebastien/boilerplate"], renderer=renderer)
+    (second,) = export_many(["@sebastien/boilerplate"], renderer=renderer)
+    assert second.result().rendered is first.result().rendered
+
+
+def test_export_graph(observable, tmp_path):
+    api = observable()
+    results = list(export_graph(["@sebastien/apidoc"], str(tmp_path), format="js"))
+    assert not any(_.error for _ in results)
+    assert sorted(os.listdir(tmp_path)) == [
+        "28e219d819b6b627@2228.js",
+        "8ed172ec5b1d17d2@230.js",
+    ]
+    assert "export const html" in (tmp_path / "28e219d819b6b627@2228.js").read_text()
+    # Each notebook of the graph is fetched and parsed once
+    assert api.metrics.get("cache.parsed.misses") == 2
+    assert sorted(api.api.requests) == sorted(
+        [
+            "document/@sebastien/apidoc",
+            "@sebastien/apidoc@230.js",
+            "document/@sebastien/boilerplate",
+            "@sebastien/boilerplate@2228.js",
+        ]
+    )
+    results = list(export_graph(["@sebastien/apidoc"], str(tmp_path), format="raw"))
+    assert [_.written for _ in results] == [True, True]
+    assert (tmp_path / "28e219d819b6b627@2228.js").read_text() == RAW_TEXT
+
+
+def test_export_graph_errors(observable, tmp_path):
+    observable()
+    (result,) = export_graph(["@sebastien/missing"], str(tmp_path))
+    assert result.error and "404" in result.error
+
+
+# EOF
@@ -0,0 +1,47 @@
+import re
+from observableexport.api import notebook_bundle
+
+BOILERPLATE = "28e219d819b6b627@2228"
+RE_CELL = re.compile(r"^// @cell\('(?P<name>[^']+)'", re.MULTILINE)
+
+
+def test_bundle_tree_shaking(observable):
+    api = observable()
+    notebook = api.load("@sebastien/apidoc")
+    boilerplate = api.load("@sebastien/boilerplate")
+    assert notebook and boilerplate
+    bundle = "".join(notebook_bundle(notebook))
+    assert "import " not in bundle
+    scope, exported = bundle.split("})();\n", 1)
+    assert f"// @notebook('{BOILERPLATE}')" in scope
+    # Only the cells reachable from the imported ones are included, in
+    # dependency order.
+    imported = {_.name for _ in notebook.cells if _.source != notebook.id}
+    reachable = [
+        _.name
+        for _ in boilerplate.closure(imported)
+        if _.source == boilerplate.id and not _.isEmpty
+    ]
+    assert RE_CELL.findall(scope) == reachable
+    assert len(reachable) < len(boilerplate.defined)
+    # The imported cells are destructured from the scope of their notebook
+    names = re.search(r"const \{(.+)\} = __28e219d819b6b627_2228;", exported)
+    assert names and set(names.group(1).split(", ")) == imported
+    assert set(RE_CELL.findall(exported)) == {
+        _.name for _ in notebook.defined if not _.isSpecial
+    }
+
+
+def test_bundle_transitive_exports(observable):
+    api = observable()
+    notebook = api.load("@sebastien/apidoc")
+    assert notebook
+    bundle = "".join(notebook_bundle(notebook, transitiveExports=True))
+    exports = re.search(r"^export \{(.+)\};$", bundle, re.MULTILINE)
+    assert exports
+    assert set(exports.group(1).split(", ")) == {
+        _.name for _ in notebook.cells if _.source != notebook.id
+    }
+
+
+# EOF
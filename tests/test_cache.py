@@ -0,0 +1,161 @@
+import os
+import gzip
+import time
+import pytest
+from observableexport.cache import (
+    Cache,
+    MemoryCache,
+    DirectoryCache,
+    LRUCache,
+    iterlines,
+)
+from observableexport.api import directory_cache, isImmutable, MUTABLE_TTL
+from observableexport.output import UMASK
+from conftest import ROUTES
+
+TEXT = "const a = 1;\nconst b = 'é';\n" * 100
+
+
+@pytest.fixture(params=["memory", "memory-raw", "directory", "directory-raw"])
+def cache(request, tmp_path):
+    level = 0 if request.param.endswith("-raw") else 6
+    if request.param.startswith("memory"):
+        return MemoryCache(level)
+    else:
+        return DirectoryCache(str(tmp_path / "cache"), level)
+
+
+def test_cache_is_abstract():
+    with pytest.raises(TypeError):
+        Cache()
+
+
+def test_cache_roundtrip(cache):
+    assert "a" not in cache
+    assert cache.get("a") is None
+    cache.set("a", TEXT)
+    assert "a" in cache
+    assert cache.get("a") == TEXT
+    assert b"".join(cache.chunks("a")).decode("utf8") == TEXT
+    assert "".join(cache.lines("a")) == TEXT
+    cache.remove("a")
+    assert "a" not in cache
+
+
+def test_cache_writer(cache):
+    with cache.writer("a") as write:
+        for line in TEXT.encode("utf8").splitlines(keepends=True):
+            write(line)
+    assert cache.get("a") == TEXT
+    # Nothing is stored when the writer fails
+    with pytest.raises(RuntimeError):
+        with cache.writer("b") as write:
+            write(b"partial")
+            raise RuntimeError("failed")
+    assert "b" not in cache
+    cache.clear()
+    assert "a" not in cache
+
+
+def test_directory_cache_file(tmp_path):
+    raw = DirectoryCache(str(tmp_path / "raw"), 0).set("a", TEXT)
+    assert open(raw.file("a"), encoding="utf8").read() == TEXT
+    # Entries stored with another level are still found
+    compressed = DirectoryCache(str(tmp_path / "raw"), 6)
+    assert compressed.get("a") == TEXT
+
+
+def test_directory_cache_expires_mutable_entries(tmp_path):
+    cache = directory_cache(str(tmp_path))
+    latest = "document/@sebastien/boilerplate"
+    versioned = "@sebastien/boilerplate@2228.js"
+    assert not isImmutable(latest)
+    assert isImmutable(versioned)
+    assert isImmutable("document/@sebastien/boilerplate@2228")
+    assert isImmutable("28e219d819b6b627@2228.js#0123456789abcdef")
+    cache.set(latest, "{}").set(versioned, TEXT)
+    assert latest in cache and versioned in cache
+    # Once older than the TTL, only the versioned entry is kept
+    past = time.time() - MUTABLE_TTL - 1
+    for key in (latest, versioned):
+        os.utime(cache.find(key)[1], (past, past))
+    assert latest not in cache
+    assert cache.get(latest) is None
+    assert cache.get(versioned) == TEXT
+    # Expired entries are replaced
+    cache.set(latest, "[]")
+    assert cache.get(latest) == "[]"
+
+
+
+def test_directory_cache_files(tmp_path):
+    cache = DirectoryCache(str(tmp_path), 6).set("a", TEXT)
+    path = cache.find("a")[1]
+    # Entries get the permissions of regular files, not those of `mkstemp`
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~UMASK
+    # Temporary files of entries being written are not counted
+    with cache.writer("b") as write:
+        write(b"partial")
+        assert len(cache) == 1
+    assert len(cache) == 2
+
+
+def test_request_refetches_expired_entries(observable, tmp_path):
+    api = observable().api
+    api.cache = directory_cache(str(tmp_path))
+    url = "document/@sebastien/boilerplate"
+    ensure = api.ensure
+
+    def expiring(url: str, key=None) -> str:
+        # The entry expires right after being ensured
+        cache_key = ensure(url, key)
+        past = time.time() - MUTABLE_TTL - 1
+        os.utime(api.cache.find(cache_key)[1], (past, past))
+        return cache_key
+
+    api.ensure = expiring
+    assert api.request(url) == ROUTES[url]
+    assert "".join(api.lines(url)) == ROUTES[url]
+    assert api.requests == [url] * 3
+
+
+def test_iterlines():
+    data = TEXT.encode("utf8")
+    # Chunks can split lines as well as multi-byte characters
+    for size in (1, 2, 7, len(data)):
+        chunks = (data[i : i + size] for i in range(0, len(data), size))
+        assert list(iterlines(chunks)) == TEXT.splitlines(keepends=True)
+    assert list(iterlines([b"a\nb"])) == ["a\n", "b"]
+    assert list(iterlines([])) == []
+
+
+def test_cache_compression(tmp_path):
+    assert MemoryCache(6).set("a", TEXT).size < MemoryCache(0).set("a", TEXT).size
+    cache = DirectoryCache(str(tmp_path), 6).set("a", TEXT)
+    found = cache.find("a")
+    assert found and found[0]
+    # Entries are stored as gzip files, which raw exports can't copy as is
+    with gzip.open(found[1], "rt", encoding="utf8") as f:
+        assert f.read() == TEXT
+    assert cache.file("a") is None
+    assert cache.size < len(TEXT.encode("utf8"))
+
+
+def test_lru_cache():
+    cache: LRUCache[int] = LRUCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache["a"] == 1
+    cache["c"] = 3
+    # "b" is the least recently used
+    assert "b" not in cache
+    assert len(cache) == 2
+    with pytest.raises(KeyError):
+        cache["b"]
+    cache.remove("a")
+    assert cache.get("a") is None
+    cache.clear()
+    assert len(cache) == 0
+
+
+# EOF
@@ -0,0 +1,91 @@
+from conftest import RAW
+from observableexport.model import Notebook
+from observableexport.parser import parse
+from observableexport.diff import diff, stable, Change, ADDED, REMOVED, MODIFIED, MOVED
+
+STR = '''    {
+      name: "str",
+      value: (function(){return(
+_ => "" + _
+)})
+    },
+'''
+
+
+def notebook(text: str) -> Notebook:
+    parsed, _ = parse(text)
+    assert parsed
+    return parsed
+
+
+def build(id: str, *cells: tuple[str, str, str]) -> Notebook:
+    """Builds a notebook from `(name, source, body)` cells."""
+    nb = Notebook(id)
+    for name, source, body in cells:
+        nb.addCell(name, source).addLine(body)
+    return nb
+
+
+def test_diff_version_bump():
+    """Two versions with identical content have no changes, even though
+    their cells come from a different (versioned) notebook id."""
+    before = notebook(RAW)
+    after = notebook(RAW.replace("28e219d819b6b627@2228", "28e219d819b6b627@2229"))
+    assert after.id == "28e219d819b6b627@2229"
+    assert diff(before, after) == []
+
+
+def test_diff_imported_version_bump():
+    before = build("a@1", ("x", "a@1", "1"), ("y", "b@3", "2"))
+    after = build("a@2", ("x", "a@2", "1"), ("y", "b@4", "2"))
+    assert diff(before, after) == []
+    # The origin of imported cells is still part of their fingerprint
+    moved = build("a@2", ("x", "a@2", "1"), ("y", "c@4", "2"))
+    assert diff(before, moved) == [Change("y", MODIFIED, 1, 1)]
+
+
+def test_diff_modified():
+    assert STR in RAW
+    before = notebook(RAW)
+    after = notebook(RAW.replace('_ => "" + _', "_ => String(_)"))
+    (change,) = diff(before, after)
+    assert change.name == "str"
+    assert change.change == MODIFIED
+    assert change.before == change.after
+
+
+def test_diff_added_removed():
+    before = notebook(RAW)
+    after = notebook(RAW.replace(STR, ""))
+    (removed,) = diff(before, after)
+    assert (removed.name, removed.change, removed.after) == ("str", REMOVED, None)
+    (added,) = diff(after, before)
+    assert (added.name, added.change, added.before) == ("str", ADDED, None)
+    assert added.after == removed.before
+
+
+def test_diff_moved():
+    before = build("a@1", *((_, "a@1", _) for _ in "abcd"))
+    after = build("a@2", *((_, "a@2", _) for _ in "bcad"))
+    assert diff(before, after) == [Change("a", MOVED, 0, 2)]
+
+
+def test_diff_anonymous():
+    """Anonymous cells are matched by content, and told apart when they are
+    identical."""
+    before = build("a@1", (None, "a@1", "md`x`"), (None, "a@1", "md`x`"))
+    after = build("a@1", (None, "a@1", "md`x`"))
+    (change,) = diff(before, after)
+    assert change.change == REMOVED
+    assert change.before == 1
+
+
+def test_stable():
+    positions = {k: i for i, k in enumerate("abcdef")}
+    assert stable(list("abcdef"), positions) == set("abcdef")
+    in_place = stable(list("bacdfe"), positions)
+    assert len(in_place) == 4
+    assert {"c", "d"} <= in_place
+
+
+# EOF
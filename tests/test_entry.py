@@ -0,0 +1,54 @@
+import re
+import pytest
+from conftest import BASE, PROBLEMATIC
+from observableexport.bulk import render
+from observableexport.parser import parse
+from observableexport.command import run
+
+SOURCE = str(BASE / "data-notebook-raw-problematic.js")
+
+
+def test_closure():
+    notebook, _ = parse(PROBLEMATIC)
+    assert notebook
+    names = [_.name for _ in notebook.closure(["doc"])]
+    assert set(names) == {"doc", "docs", "docFunction", "docPrototype", "html"}
+    # Dependencies come before their dependents, and builtins are ignored
+    assert names.index("docPrototype") < names.index("docFunction")
+    assert names.index("docFunction") < names.index("doc")
+    assert names[-1] == "doc"
+    assert [_.name for _ in notebook.ancestry("doc")] == names[:-1]
+    assert notebook.closure(["md", "missing"]) == []
+
+
+def test_render_entries(observable):
+    observable()
+    output, _ = render(PROBLEMATIC, "js", {}, {}, entries=["doc"])
+    exported = re.findall(r"^export const (\w+)", output, re.MULTILINE)
+    assert set(exported) == {"doc", "docs", "docFunction", "docPrototype"}
+    (imported,) = re.findall(r"^import \{(.+)\} from", output, re.MULTILINE)
+    assert imported == "html"
+
+
+
+def test_render_imported_entry(observable):
+    observable()
+    output, _ = render(PROBLEMATIC, "js", {}, {}, entries=["html"])
+    assert re.findall(r"^export const (\w+)", output, re.MULTILINE) == []
+    (imported,) = re.findall(r"^import \{(.+)\} from", output, re.MULTILINE)
+    assert imported == "html"
+    output, _ = render(PROBLEMATIC, "bundle", {}, {}, entries=["html"])
+    assert "const {html} = __28e219d819b6b627_2228;" in output
+
+
+def test_unknown_entry(observable, capsys):
+    observable()
+    with pytest.raises(RuntimeError, match="Cell not found in 8ed172ec5b1d17d2@230"):
+        render(PROBLEMATIC, "js", {}, {}, entries=["typo"])
+    assert run([SOURCE, "--entry", "doc,typo"]) == 1
+    assert capsys.readouterr().err == (
+        "!!! ERR Cell not found in 8ed172ec5b1d17d2@230: typo\n"
+    )
+
+
+# EOF
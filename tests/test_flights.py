@@ -0,0 +1,103 @@
+import threading
+from observableexport.scheduler import SingleFlight
+from observableexport.cache import MemoryCache
+
+
+def test_single_flight_coalesces():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls: list[int] = []
+
+    def call() -> int:
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42
+
+    results: list[int] = []
+    leader = threading.Thread(target=lambda: results.append(flights.run("k", call)))
+    leader.start()
+    started.wait(5)
+    followers = [
+        threading.Thread(target=lambda: results.append(flights.run("k", call)))
+        for _ in range(4)
+    ]
+    for _ in followers:
+        _.start()
+    # Followers wait for the leader's flight
+    while flights.metrics.counters.get("coalesced", 0) < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for _ in [leader, *followers]:
+        _.join(5)
+    assert results == [42] * 5
+    assert len(calls) == 1
+    assert not flights.flights
+
+
+def test_single_flight_shares_errors():
+    flights = SingleFlight()
+
+    def fail():
+        raise RuntimeError("failed")
+
+    for _ in range(2):
+        try:
+            flights.run("k", fail)
+            assert False, "Should have raised"
+        except RuntimeError as e:
+            assert str(e) == "failed"
+    assert not flights.flights
+
+
+class StaleCache(MemoryCache):
+    """A cache whose first lookup misses, like a lookup that happened just
+    before a concurrent flight filled the entry."""
+
+    def __init__(self):
+        super().__init__()
+        self.lookups: int = 0
+
+    def __contains__(self, key: str) -> bool:
+        self.lookups += 1
+        return self.lookups > 1 and super().__contains__(key)
+
+
+def test_ensure_checks_the_cache_within_the_flight(observable):
+    api = observable().api
+    api.cache = StaleCache()
+    api.cache.set(api.cacheKey("document/@sebastien/boilerplate"), "{}")
+    assert api.request("document/@sebastien/boilerplate") == "{}"
+    assert api.requests == []
+
+
+def test_concurrent_requests_download_once(observable):
+    api = observable().api
+    threads = [
+        threading.Thread(target=api.request, args=("@sebastien/apidoc@230.js",))
+        for _ in range(8)
+    ]
+    for _ in threads:
+        _.start()
+    for _ in threads:
+        _.join(5)
+    assert api.requests == ["@sebastien/apidoc@230.js"]
+    # Later requests are served from the cache
+    api.request("@sebastien/apidoc@230.js")
+    assert len(api.requests) == 1
+
+
+def test_resolve_and_load_once(observable):
+    notebooks = observable()
+    ref = notebooks.resolve("@sebastien/apidoc")
+    assert ref.key == "8ed172ec5b1d17d2@230"
+    assert notebooks.resolve("@sebastien/apidoc") is ref
+    assert notebooks.load(ref) is notebooks.load("@sebastien/apidoc")
+    assert notebooks.api.requests == [
+        "document/@sebastien/apidoc",
+        "@sebastien/apidoc@230.js",
+    ]
+
+
+# EOF
@@ -0,0 +1,50 @@
+import hashlib
+from conftest import ROUTES
+from observableexport.api import ObservableAPI
+
+VERSIONED = "@sebastien/boilerplate@2228.js"
+CANONICAL = "28e219d819b6b627@2228.js"
+
+
+def test_cache_key_partitions(monkeypatch):
+    monkeypatch.delenv("OBSERVABLE_API_KEY", raising=False)
+    api = ObservableAPI()
+    # Public requests are shared, the others partitioned by credential
+    assert api.cacheKey("document/@sebastien/boilerplate", "a") == (
+        "document/@sebastien/boilerplate"
+    )
+    assert api.cacheKey("d/0123456789abcdef.js") == "d/0123456789abcdef.js"
+    credential = hashlib.sha256(b"a").hexdigest()[:16]
+    assert api.cacheKey("d/0123456789abcdef.js", "a") == (
+        f"d/0123456789abcdef.js#{credential}"
+    )
+    assert api.cacheKey("d/0123456789abcdef.js", "b") != api.cacheKey(
+        "d/0123456789abcdef.js", "a"
+    )
+    api.alias("d/0123456789abcdef@1.js", "0123456789abcdef@1.js")
+    assert api.cacheKey("d/0123456789abcdef@1.js", "a") == (
+        f"0123456789abcdef@1.js#{credential}"
+    )
+    api.alias("@user/name@1.js", "0123456789abcdef@1.js", shared=True)
+    assert api.cacheKey("@user/name@1.js", "a") == "0123456789abcdef@1.js"
+
+
+def test_equivalent_urls_share_entry(observable, monkeypatch):
+    versioned = "document/@sebastien/boilerplate@2228"
+    api = observable(
+        dict(ROUTES, **{versioned: ROUTES["document/@sebastien/boilerplate"]})
+    )
+    assert api.load("@sebastien/boilerplate")
+    # The public, private and unversioned URLs all alias the same entry
+    for url in (VERSIONED, "d/28e219d819b6b627@2228.js", "@sebastien/boilerplate.js"):
+        assert api.api.cacheKey(url) == CANONICAL
+        assert api.api.isCached(url)
+    monkeypatch.setenv("OBSERVABLE_API_KEY", "secret")
+    assert api.api.cacheKey(VERSIONED) == CANONICAL
+    # Loading by name, version or reference reuses the same download
+    assert api.load("@sebastien/boilerplate@2228")
+    assert api.load(api.resolve("@sebastien/boilerplate"))
+    assert api.api.requests.count(VERSIONED) == 1
+
+
+# EOF
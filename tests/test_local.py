@@ -0,0 +1,52 @@
+import os
+import sys
+import subprocess
+from conftest import BASE, RAW
+from observableexport.parser import parse
+from observableexport.command import run
+
+SOURCE = str(BASE / "data-notebook-raw.js")
+
+
+def export(*args: str, stdin: str = "") -> str:
+    """Runs the CLI, which must not need the network for local inputs."""
+    return subprocess.run(
+        [sys.executable, "-m", "observableexport", *args],
+        env=dict(
+            os.environ,
+            PYTHONPATH=str(BASE.parent / "src" / "py"),
+            OBSERVABLE_CACHE="",
+        ),
+        input=stdin,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def test_local_file_raw(tmp_path):
+    output = tmp_path / "raw.js"
+    export(SOURCE, "-t", "raw", "-o", str(output))
+    assert output.read_text() == RAW
+
+
+def test_local_file_and_stdin():
+    js = export(SOURCE, "-t", "js")
+    assert js == export("-", "-t", "js", stdin=RAW)
+    notebook, _ = parse(RAW)
+    assert notebook
+    for cell in notebook.defined:
+        if not cell.isSpecial:
+            assert f"export const {cell.name} = (" in js
+
+
+def test_local_empty_file(observable, tmp_path, capsys):
+    path = tmp_path / "empty.js"
+    path.write_text("")
+    # An empty file has no notebook, which the CLI reports as an error
+    assert observable().parseFile(str(path)) is None
+    assert run([str(path), "-t", "js"]) == 1
+    assert capsys.readouterr().err == f"!!! ERR Could not parse notebook: {path}\n"
+
+
+# EOF
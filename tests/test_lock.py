@@ -0,0 +1,54 @@
+import hashlib
+import pytest
+from conftest import RAW, PROBLEMATIC, ROUTES
+from observableexport.lock import Lockfile, notebook_lock
+
+APIDOC = "8ed172ec5b1d17d2@230"
+BOILERPLATE = "28e219d819b6b627@2228"
+
+
+def sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+
+def test_lock_roundtrip(observable, tmp_path):
+    observable()
+    lock = notebook_lock(["@sebastien/apidoc"])
+    assert set(lock.refs) == {APIDOC, BOILERPLATE}
+    assert lock.hashes == {APIDOC: sha256(PROBLEMATIC), BOILERPLATE: sha256(RAW)}
+    assert lock.names["@sebastien/apidoc"] == APIDOC
+    assert lock.names["@sebastien/boilerplate"] == BOILERPLATE
+    path = str(tmp_path / "observable-lock.json")
+    assert lock.save(path)
+    assert not lock.save(path)
+    loaded = Lockfile.Load(path)
+    assert loaded == lock
+
+
+def test_locked_build(observable):
+    observable()
+    lock = notebook_lock(["@sebastien/apidoc"])
+    # A locked build only fetches the pinned versioned exports
+    api = observable()
+    api.lock(lock)
+    assert api.load("@sebastien/apidoc")
+    assert api.api.requests == ["@sebastien/apidoc@230.js"]
+    assert api.verified == {APIDOC}
+    with pytest.raises(RuntimeError, match="not pinned"):
+        api.resolve("@sebastien/other")
+
+
+def test_locked_build_verifies_hashes(observable):
+    observable()
+    lock = notebook_lock(["@sebastien/boilerplate"])
+    routes = dict(ROUTES)
+    routes["@sebastien/boilerplate@2228.js"] = RAW.replace("idem", "same")
+    api = observable(routes)
+    api.lock(lock)
+    with pytest.raises(RuntimeError, match="does not match the lockfile"):
+        api.load("@sebastien/boilerplate")
+    # The export that doesn't match is not kept
+    assert not api.api.isCached("@sebastien/boilerplate@2228.js")
+
+
+# EOF
@@ -0,0 +1,72 @@
+import json
+import pytest
+from conftest import RAW, FakeObservableAPI, ROUTES
+from observableexport.metrics import Metrics, Histogram, endpoint
+
+
+def test_metrics_counters():
+    metrics = Metrics()
+    assert metrics.ratio("http") is None
+    metrics.hit("http").hit("http").hit("http").miss("http")
+    metrics.inc("requests", 2)
+    assert metrics.get("cache.http.hits") == 3
+    assert metrics.get("requests") == 2
+    assert metrics.ratio("http") == 0.75
+    metrics.reset()
+    assert metrics.get("requests") == 0
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1.0))
+    for _ in (0.05, 0.1, 0.5, 2.0):
+        histogram.add(_)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.max == 2.0
+    assert histogram.mean == pytest.approx(2.65 / 4)
+    assert histogram.asDict()["buckets"] == {"0.1": 2, "1.0": 1, "inf": 1}
+
+
+def test_metrics_report(tmp_path, capsys):
+    metrics = Metrics().latency("notebook", 0.02).latency("notebook", 0.2)
+    metrics.miss("http")
+    path = tmp_path / "metrics.json"
+    metrics.dump(str(path))
+    report = json.loads(path.read_text())
+    assert report["counters"] == {"cache.http.misses": 1}
+    assert report["latencies"]["notebook"]["count"] == 2
+    metrics.dump("-")
+    assert json.loads(capsys.readouterr().err) == report
+
+
+def test_endpoint():
+    assert endpoint("@sebastien/boilerplate@2228.js") == "notebook"
+    assert endpoint("d/28e219d819b6b627@2228.js?v=3") == "d"
+    assert endpoint("document/@sebastien/boilerplate") == "document"
+    assert endpoint("") == "/"
+
+
+def test_api_counters():
+    api = FakeObservableAPI(dict(ROUTES))
+    url = "@sebastien/boilerplate@2228.js"
+    api.statuses[url] = [429]
+    assert api.request(url) == RAW
+    assert api.request(url) == RAW
+    size = len(RAW.encode("utf8"))
+    metrics = api.metrics
+    # The throttled request was retried once, and the response cached
+    assert api.requests == [url, url]
+    assert metrics.get("requests") == 2
+    assert metrics.get("retries") == 1
+    assert metrics.get("throttled.429") == 1
+    assert metrics.get("cache.response.misses") == 1
+    assert metrics.get("cache.response.hits") == 1
+    assert metrics.get("transfer.identity") == 1
+    assert metrics.get("bytes.downloaded") == size
+    assert metrics.get("bytes.decoded") == size
+    assert metrics.latencies["notebook"].count == 2
+    with pytest.raises(RuntimeError, match="404"):
+        api.request("@sebastien/missing.js")
+    assert metrics.get("errors.404") == 1
+
+
+# EOF
@@ -0,0 +1,52 @@
+import os
+import pytest
+from observableexport.output import write_if_changed, AtomicOutput, UMASK
+
+
+def test_write_if_changed(tmp_path):
+    path = str(tmp_path / "out.js")
+    assert write_if_changed(path, "a")
+    mtime = os.stat(path).st_mtime_ns
+    assert not write_if_changed(path, "a")
+    assert os.stat(path).st_mtime_ns == mtime
+    assert write_if_changed(path, b"b")
+    assert open(path).read() == "b"
+    # No temporary file is left behind
+    assert os.listdir(tmp_path) == ["out.js"]
+
+
+def test_atomic_output_keeps_file_on_error(tmp_path):
+    path = tmp_path / "out.js"
+    path.write_text("before")
+    with pytest.raises(RuntimeError):
+        with AtomicOutput(str(path)) as f:
+            f.write(b"partial")
+            raise RuntimeError("failed")
+    assert path.read_text() == "before"
+    assert os.listdir(tmp_path) == ["out.js"]
+
+
+def test_atomic_output_keeps_permissions(tmp_path):
+    path = tmp_path / "out.sh"
+    path.write_text("before")
+    os.chmod(path, 0o750)
+    out = AtomicOutput(str(path))
+    with out as f:
+        f.write(b"after")
+    assert out.written
+    assert path.read_text() == "after"
+    assert os.stat(path).st_mode & 0o777 == 0o750
+
+
+def test_atomic_output_new_file_permissions(tmp_path):
+    """New files get the permissions of a regular `open()`, not the 0600 of
+    the temporary file."""
+    mask = os.umask(0o022)
+    os.umask(mask)
+    assert UMASK == mask
+    path = tmp_path / "new.js"
+    assert write_if_changed(str(path), "a")
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~mask
+
+
+# EOF
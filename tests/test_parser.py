@@ -0,0 +1,43 @@
+import io
+import sys
+from conftest import BASE, PROBLEMATIC
+from observableexport.model import Notebook
+from observableexport.parser import parse
+
+# `@sebastien/apidoc` imports `@sebastien/boilerplate`, whose module is in
+# the same export.
+IMPORTED = "@sebastien/boilerplate"
+
+
+def cells(notebook: Notebook) -> list[tuple]:
+    return [
+        (_.name, _.source, _.type, _.inputs, list(_.value)) for _ in notebook.cells
+    ]
+
+
+def test_parse_skips_imported_bodies(observable):
+    full, modules = parse(PROBLEMATIC)
+    skipped, skippedModules = parse(PROBLEMATIC, skipsImported=True)
+    assert full and skipped
+    assert cells(skipped) == cells(full)
+    # The cells of the imported modules are kept, without their bodies
+    imported = skippedModules[IMPORTED].cells
+    assert [_.name for _ in imported] == [_.name for _ in modules[IMPORTED].cells]
+    assert all(_.isEmpty for _ in imported)
+    # The API only returns the notebook itself, so it skips them
+    assert cells(observable().parse(PROBLEMATIC)) == cells(full)
+
+
+def test_parse_file_stdin(observable, monkeypatch):
+    """Stdin is parsed like files, in a single pass."""
+    path = str(BASE / "data-notebook-raw-problematic.js")
+    api = observable()
+    parsed = api.parseFile(path)
+    stdin = io.TextIOWrapper(io.BytesIO(PROBLEMATIC.encode("utf8")))
+    monkeypatch.setattr(sys, "stdin", stdin)
+    piped = api.parseFile("-")
+    assert parsed and piped
+    assert cells(piped) == cells(parsed)
+
+
+# EOF
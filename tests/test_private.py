@@ -0,0 +1,44 @@
+import pytest
+from conftest import RAW, ROUTES
+from observableexport.model import NotebookRef
+
+ID = "0123456789abcdef"
+PRIVATE = RAW.replace(
+    "// URL: https://observablehq.com/@sebastien/boilerplate",
+    f"// URL: https://observablehq.com/d/{ID}",
+).replace("// Version: 2228", "// Version: 12")
+
+
+@pytest.fixture
+def private(observable, monkeypatch):
+    monkeypatch.setenv("OBSERVABLE_API_KEY", "secret")
+    return observable(dict(ROUTES, **{f"d/{ID}.js": PRIVATE}))
+
+
+def test_private_resolve_from_header(private):
+    ref = private.resolve(ID)
+    assert ref == NotebookRef(id=ID, version=12, username="sebastien", name=None)
+    assert private.api.requests == [f"d/{ID}.js"]
+    assert private.api.metrics.get("headers") == 1
+    # Only the header was read, so the export itself is not cached
+    assert not private.api.isCached(f"d/{ID}@12.js")
+
+
+def test_private_load_downloads_once(private):
+    notebook = private.load(ID)
+    assert notebook and notebook.cells
+    # The export is resolved and downloaded with a single request, and
+    # cached under its versioned URL.
+    assert private.api.requests == [f"d/{ID}.js"]
+    assert private.api.isCached(f"d/{ID}@12.js")
+    cache_key = private.api.cacheKey(f"d/{ID}@12.js")
+    assert cache_key.startswith(f"{ID}@12.js#")
+
+
+def test_private_requires_key(observable):
+    api = observable(dict(ROUTES, **{f"d/{ID}.js": PRIVATE}))
+    with pytest.raises(RuntimeError, match="OBSERVABLE_API_KEY"):
+        api.resolve(ID)
+
+
+# EOF
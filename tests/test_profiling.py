@@ -0,0 +1,85 @@
+import json
+import pytest
+from conftest import BASE
+from observableexport.command import run
+from observableexport.profiling import Profiler, PROFILER, NULL_SPAN
+
+
+@pytest.fixture
+def profiler():
+    PROFILER.enable().reset()
+    yield PROFILER
+    PROFILER.disable().reset()
+
+
+def test_profiler_disabled():
+    profiler = Profiler()
+    assert profiler.span("parse") is NULL_SPAN
+    items = iter(["a", "b"])
+    assert profiler.iterated("render", items) is items
+
+    @profiler.timed("work")
+    def work(n: int) -> int:
+        return n * 2
+
+    assert work(2) == 4
+    assert profiler.report()["phases"] == {}
+
+
+def test_profiler_spans(tmp_path):
+    profiler = Profiler().enable()
+    with profiler.span("parse") as s:
+        s.add(10)
+    with profiler.span("parse") as s:
+        s.add(5)
+
+    @profiler.timed("work")
+    def work(n: int) -> int:
+        return n * 2
+
+    @profiler.timed("lines")
+    def lines():
+        yield "ab"
+        yield "cde"
+
+    assert work(2) == 4
+    assert list(lines()) == ["ab", "cde"]
+    assert "".join(profiler.iterated("render", iter(["x", "yz"]))) == "xyz"
+    phases = profiler.report()["phases"]
+    assert list(phases) == ["lines", "parse", "render", "work"]
+    assert phases["parse"]["calls"] == 2 and phases["parse"]["bytes"] == 15
+    assert phases["lines"]["bytes"] == 5
+    assert phases["render"]["bytes"] == 3
+    assert phases["work"]["calls"] == 1
+    path = tmp_path / "profile.json"
+    profiler.dump(str(path))
+    report = json.loads(path.read_text())
+    assert report["wall"] >= 0 and report["phases"] == phases
+    profiler.reset()
+    assert profiler.report()["phases"] == {}
+
+
+def test_api_spans(observable, profiler):
+    api = observable()
+    assert api.load("@sebastien/boilerplate")
+    phases = profiler.report()["phases"]
+    assert phases["api.request"]["calls"] == 2
+    assert phases["api.request"]["bytes"] > 0
+    assert phases["notebook.resolve"]["calls"] == 1
+    assert phases["notebook.parse"]["calls"] == 1
+
+
+def test_profile_option(tmp_path, capsys):
+    path = tmp_path / "profile.json"
+    source = str(BASE / "data-notebook-raw.js")
+    try:
+        assert run([source, "-t", "js", "--profile", str(path)]) == 0
+    finally:
+        PROFILER.disable().reset()
+    assert "export const html" in capsys.readouterr().out
+    report = json.loads(path.read_text())
+    assert report["wall"] > 0
+    assert {"notebook.parse", "export.js"} <= set(report["phases"])
+
+
+# EOF
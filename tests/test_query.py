@@ -0,0 +1,49 @@
+import json
+from conftest import BASE
+from observableexport.command import query
+from observableexport.model import Notebook
+
+SOURCE = str(BASE / "data-notebook-raw-problematic.js")
+
+
+def build() -> Notebook:
+    """Builds `a <- b <- c`, `a <- d`, with `e` imported and shadowed."""
+    nb = Notebook("n@1")
+    for name, source, inputs in (
+        ("a", "n@1", []),
+        ("b", "n@1", ["a"]),
+        ("c", "n@1", ["b", "width"]),
+        ("d", "n@1", ["a"]),
+        ("e", "m@1", []),
+        ("e", "n@1", ["c"]),
+    ):
+        nb.addCell(name, source).inputs = inputs
+    return nb
+
+
+def test_impact():
+    nb = build()
+    assert nb.dependents["a"] == ["b", "d"]
+    assert nb.index["e"].source == "n@1"
+    impact = [_.name for _ in nb.impact("a")]
+    assert set(impact) == {"b", "c", "d", "e"}
+    assert impact.index("b") < impact.index("c") < impact.index("e")
+    assert [_.name for _ in nb.impact("e")] == []
+    assert [_.name for _ in nb.ancestry("e")] == ["a", "b", "c"]
+    # The indexes are maintained until the cells change
+    nb.addCell("f", "n@1").inputs = ["d"]
+    assert "f" in nb.dependents["d"]
+    assert "f" in [_.name for _ in nb.impact("a")]
+
+
+def test_query_command(capsys):
+    assert query(["impact", SOURCE, "docPrototype"]) == 0
+    res = json.loads(capsys.readouterr().out)
+    assert set(res["docPrototype"]) >= {"docFunction", "doc", "Docs"}
+    assert query(["inputs", SOURCE, "doc", "-t", "raw"]) == 0
+    assert capsys.readouterr().out.split() == ["docs", "docFunction"]
+    assert query(["dependents", SOURCE, "missing"]) == 1
+    assert "Cell not found" in capsys.readouterr().err
+
+
+# EOF
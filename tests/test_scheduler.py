@@ -0,0 +1,145 @@
+import time
+import threading
+from email.utils import formatdate
+from typing import Optional
+import pytest
+from observableexport import scheduler
+from observableexport.scheduler import TokenBucket, Scheduler
+from conftest import FakeObservableAPI, ROUTES
+
+
+class Clock:
+    """A fake clock, where sleeping advances the time instantly."""
+
+    def __init__(self):
+        self.now: float = 1000.0
+        self.slept: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, delay: float):
+        self.slept.append(delay)
+        self.now += delay
+
+
+class Response:
+    def __init__(self, status_code: int = 200, headers: Optional[dict] = None):
+        self.status_code: int = status_code
+        self.headers: dict = headers or {}
+        self.isClosed: bool = False
+
+    def close(self):
+        self.isClosed = True
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(scheduler, "time", clock)
+    return clock
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    # The burst is available at once, then tokens come at the given rate
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert clock.slept == [0.5]
+    clock.now += 10
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.slept == [0.5]
+
+
+def test_scheduler_aimd(clock):
+    s = Scheduler(concurrency=8, minConcurrency=2)
+    s.onThrottled(Response(429))
+    assert s.limit == 4
+    s.onThrottled(Response(503))
+    s.onThrottled(Response(503))
+    assert s.limit == 2
+    assert s.metrics.get("throttled.503") == 2
+    # The limit grows by one after `limit` consecutive successes
+    for _ in range(2):
+        s.onSuccess()
+    assert s.limit == 3
+    for _ in range(2):
+        s.onSuccess()
+    assert s.limit == 3
+    for _ in range(100):
+        s.onSuccess()
+    assert s.limit == 8
+
+
+def test_scheduler_retries(clock):
+    responses = [Response(429, {"Retry-After": "3"}), Response(503), Response(200)]
+    sent = iter(responses)
+    s = Scheduler(concurrency=4, backoff=1.0)
+    assert s.run(lambda: next(sent)) is responses[-1]
+    # Retry-After is honoured, otherwise the backoff is exponential
+    assert clock.slept == [3.0, 2.0]
+    assert responses[0].isClosed and responses[1].isClosed
+    assert s.metrics.get("retries") == 2
+    assert s.active == 0
+    # The last response is returned once retries are exhausted
+    s = Scheduler(retries=1)
+    throttled = Response(429)
+    assert s.run(lambda: throttled) is throttled
+
+
+def test_retry_after():
+    assert Scheduler.retryAfter(Response(429)) is None
+    assert Scheduler.retryAfter(Response(429, {"Retry-After": "2.5"})) == 2.5
+    assert Scheduler.retryAfter(Response(429, {"Retry-After": "-1"})) == 0.0
+    assert Scheduler.retryAfter(Response(429, {"Retry-After": "soon"})) is None
+    date = formatdate(time.time() + 60, usegmt=True)
+    delay = Scheduler.retryAfter(Response(429, {"Retry-After": date}))
+    assert delay is not None and 55 < delay <= 60
+
+
+def test_scheduler_holds_slot_while_running():
+    """A streamed response keeps its slot until its body is read, so the
+    next request waits for it."""
+    s = Scheduler(concurrency=1)
+    reading = threading.Event()
+    done = threading.Event()
+    order: list[str] = []
+
+    def slow():
+        with s.running(lambda: Response()):
+            reading.set()
+            time.sleep(0.2)
+            order.append("slow")
+
+    def queued():
+        reading.wait()
+        with s.running(lambda: Response()):
+            order.append("next")
+        done.set()
+
+    threads = [threading.Thread(target=_) for _ in (slow, queued)]
+    for _ in threads:
+        _.start()
+    for _ in threads:
+        _.join(5)
+    assert done.is_set()
+    assert order == ["slow", "next"]
+    assert s.active == 0
+
+
+def test_api_holds_slot_while_reading():
+    api = FakeObservableAPI(dict(ROUTES))
+    with api.response("@sebastien/boilerplate@2228.js") as chunks:
+        assert next(chunks(16))
+        assert api.scheduler.active == 1
+    assert api.scheduler.active == 0
+    assert api.responses[-1].isClosed
+
+
+# EOF
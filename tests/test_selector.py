@@ -0,0 +1,80 @@
+import pickle
+from conftest import RAW, PROBLEMATIC
+from observableexport.model import Notebook
+from observableexport.parser import parse
+from observableexport.selector import Selector, globs
+
+
+def build() -> Notebook:
+    nb = Notebook("n@1")
+    nb.addCell("style", "n@1", type="html")
+    nb.addCell("styles", "n@1")
+    nb.addCell("html", "@sebastien/boilerplate")
+    nb.addCell(None, "n@1", type="md")
+    nb.addCell("docs", "n@1", type="md")
+    return nb
+
+
+def names(selector: Selector, nb: Notebook) -> list[str]:
+    return [_.name for _ in selector.select(nb).cells]
+
+
+def test_globs():
+    assert globs([]) is None
+    assert globs(["", ""]) is None
+    pattern = globs(["style", "doc*"])
+    assert pattern
+    assert pattern.match("style") and pattern.match("docs")
+    # Patterns match whole names
+    assert not pattern.match("styles")
+
+
+def test_selector_matching():
+    nb = build()
+    assert Selector().isAll
+    assert Selector().select(nb) is nb
+    assert names(Selector(include=["style*"]), nb) == ["style", "styles"]
+    assert names(Selector(exclude=["style*"]), nb) == [
+        "html",
+        "__CELL_3__",
+        "docs",
+    ]
+    assert names(Selector(types=["md"]), nb) == ["__CELL_3__", "docs"]
+    assert names(Selector(types=["md"], isNamed=True), nb) == ["docs"]
+    assert names(Selector(sources=["@sebastien/*"]), nb) == ["html"]
+    # All the criteria must match
+    selector = Selector(include=["style*"], exclude=["styles"], types=["html"])
+    assert names(selector, nb) == ["style"]
+    assert Selector(include=["html"])(nb.cells[2])
+
+
+def test_selector_pickle():
+    selector = Selector(include=["style*"], types=["html"])
+    copy = pickle.loads(pickle.dumps(selector))
+    assert names(copy, build()) == ["style"]
+
+
+def cells(nb: Notebook) -> list[tuple]:
+    # NOTE: The cells are sorted by dependencies, which depend on the
+    # cells that are selected, so we compare them in their original order.
+    return sorted((_.index, _.name, list(_.value)) for _ in nb.cells)
+
+
+def test_selector_while_parsing():
+    """Selecting while parsing gives the same cells as selecting after."""
+    for text in (RAW, PROBLEMATIC):
+        notebook, _ = parse(text)
+        assert notebook
+        for selector in (
+            Selector(exclude=["style*", "html"]),
+            Selector(include=["doc*"], types=["js"]),
+            Selector(isNamed=True),
+            Selector(sources=["@sebastien/*"]),
+        ):
+            expected = selector.select(notebook)
+            selected, _ = parse(text, selector)
+            assert selected
+            assert cells(selected) == cells(expected)
+
+
+# EOF
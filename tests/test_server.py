@@ -0,0 +1,101 @@
+import time
+import threading
+from http.client import HTTPConnection
+import pytest
+from conftest import ROUTES
+from observableexport.bulk import Renderer
+from observableexport.server import Exports, ExportServer, ExportHandler
+
+
+@pytest.fixture
+def server(observable):
+    # Versioned names are resolved with the document of that version
+    versioned = "document/@sebastien/boilerplate@2228"
+    observable(dict(ROUTES, **{versioned: ROUTES["document/@sebastien/boilerplate"]}))
+    exports = Exports()
+    server = ExportServer(exports, port=0, threads=4, isQuiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path: str, **headers):
+    connection = HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+    try:
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+
+def test_server_export(server):
+    response, body = get(server, "/@sebastien/boilerplate@2228.js")
+    assert response.status == 200
+    assert response.getheader("Content-Type").startswith("application/javascript")
+    assert "immutable" in response.getheader("Cache-Control")
+    assert b"export const str" in body
+    etag = response.getheader("ETag")
+    response, body = get(
+        server, "/@sebastien/boilerplate@2228.js", **{"If-None-Match": etag}
+    )
+    assert response.status == 304
+    assert body == b""
+    # Unversioned names resolve to the latest version
+    response, body = get(server, "/@sebastien/boilerplate.js")
+    assert response.status == 200
+    assert response.getheader("ETag") == etag
+
+
+def test_server_errors(server, monkeypatch):
+    assert ExportHandler.timeout
+    response, _ = get(server, "/@sebastien/boilerplate@2228.txt")
+    assert response.status == 404
+    response, _ = get(server, "/@sebastien/missing.js")
+    assert response.status == 502
+
+    def fail(*args):
+        raise KeyError("failed")
+
+    monkeypatch.setattr(server.exports, "get", fail)
+    response, body = get(server, "/@sebastien/boilerplate@2228.js")
+    assert response.status == 500
+    assert b"KeyError" not in body
+
+
+
+def test_stale_names_are_forgotten_once(observable):
+    observable()
+    exports = Exports()
+    forget = exports.api.forget
+    forgotten: list[str] = []
+
+    def slow(name: str, key=None):
+        forgotten.append(name)
+        time.sleep(0.05)
+        return forget(name, key)
+
+    exports.api.forget = slow
+    threads = [
+        threading.Thread(target=exports.resolve, args=("/@sebastien/boilerplate.js",))
+        for _ in range(8)
+    ]
+    for _ in threads:
+        _.start()
+    for _ in threads:
+        _.join(5)
+    assert forgotten == ["@sebastien/boilerplate"]
+
+
+def test_renderer_is_bounded(observable):
+    observable()
+    renderer = Renderer(limit=1)
+    js = renderer.render("@sebastien/boilerplate", "js")
+    assert renderer.render("@sebastien/boilerplate", "js") is js
+    renderer.render("@sebastien/boilerplate", "md")
+    assert len(renderer.rendered) == 1
+
+
+# EOF
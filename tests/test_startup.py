@@ -0,0 +1,55 @@
+import os
+import sys
+import subprocess
+from conftest import BASE
+
+# The modules that parsing the arguments must not load
+HEAVY = (
+    "observableexport.api",
+    "requests",
+    "graphlib",
+    "sqlite3",
+    "multiprocessing",
+    "tempfile",
+)
+# NOTE: `shutil` is not listed, as argparse loads it to format the help.
+
+CODE = """
+import sys
+from observableexport.command import run
+try:
+    run(sys.argv[1:])
+except SystemExit:
+    pass
+print()
+print(" ".join(sys.modules))
+"""
+
+
+def modules(*args: str) -> list[str]:
+    """Returns the modules loaded by running the CLI with the given
+    arguments, in a fresh interpreter."""
+    return subprocess.run(
+        [sys.executable, "-c", CODE, *args],
+        env=dict(os.environ, PYTHONPATH=str(BASE.parent / "src" / "py")),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()[-1].split()
+
+
+def test_help_is_fast():
+    loaded = modules("--help")
+    assert "observableexport.command" in loaded
+    for name in HEAVY:
+        assert name not in loaded
+
+
+def test_sub_command_help_is_fast():
+    for command in ("query", "diff", "serve"):
+        loaded = modules(command, "--help")
+        for name in HEAVY:
+            assert name not in loaded
+
+
+# EOF
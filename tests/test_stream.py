@@ -0,0 +1,46 @@
+import io
+from conftest import BASE, RAW
+from observableexport.cache import DirectoryCache
+from observableexport.output import copy, copychunks
+
+SOURCE = str(BASE / "data-notebook-raw.js")
+DATA = RAW.encode("utf8")
+
+
+def test_copy(tmp_path):
+    # Files are copied with `sendfile`, other outputs chunk by chunk
+    path = tmp_path / "out.js"
+    with open(path, "wb") as out:
+        assert copy(SOURCE, out) == len(DATA)
+    assert path.read_bytes() == DATA
+    out = io.BytesIO()
+    assert copy(SOURCE, out) == len(DATA)
+    assert out.getvalue() == DATA
+    out = io.BytesIO()
+    assert copychunks(io.BytesIO(DATA), out) == len(DATA)
+    assert out.getvalue() == DATA
+
+
+def test_stream_from_memory(observable):
+    api = observable()
+    out = io.BytesIO()
+    assert api.stream("@sebastien/boilerplate", out) == len(DATA)
+    assert out.getvalue() == DATA
+    assert b"".join(api.chunks("@sebastien/boilerplate")) == DATA
+    assert api.metrics.get("bytes.streamed") == len(DATA)
+    # The export is downloaded once
+    assert api.api.requests.count("@sebastien/boilerplate@2228.js") == 1
+
+
+def test_stream_from_directory(observable, tmp_path):
+    api = observable()
+    api.api.cache = DirectoryCache(str(tmp_path / "cache"), 0)
+    for _ in range(2):
+        path = tmp_path / "out.js"
+        with open(path, "wb") as out:
+            assert api.stream("@sebastien/boilerplate", out) == len(DATA)
+        assert path.read_bytes() == DATA
+    assert api.api.requests.count("@sebastien/boilerplate@2228.js") == 1
+
+
+# EOF
@@ -0,0 +1,61 @@
+from conftest import BASE
+from observableexport.model import NotebookRef
+from observableexport.symbols import (
+    SymbolIndex,
+    Symbol,
+    symbols_index,
+    notebook_ref,
+    DEFINED,
+    IMPORTED,
+)
+
+APIDOC = "8ed172ec5b1d17d2"
+BOILERPLATE = "28e219d819b6b627"
+
+
+def test_symbols_index_local(observable, tmp_path):
+    observable()
+    path = str(BASE / "data-notebook-raw-problematic.js")
+    with SymbolIndex(str(tmp_path / "index.db")) as index:
+        assert symbols_index(index, [path]) == (1, 0)
+        # The same version is not indexed again
+        assert symbols_index(index, [path]) == (0, 1)
+        assert index.lookup("doc") == [Symbol("doc", APIDOC, 230, "doc", DEFINED)]
+        (html,) = index.lookup("html", IMPORTED)
+        assert html.source == "@sebastien/boilerplate"
+        # Anonymous cells are not indexed
+        assert index.lookup("__CELL_0__") == []
+
+
+def test_symbols_index_dependencies(observable, tmp_path):
+    api = observable()
+    path = str(tmp_path / "index.db")
+    with SymbolIndex(path) as index:
+        counts = symbols_index(index, ["@sebastien/apidoc"], withDependencies=True)
+        assert counts == (2, 0)
+        assert {_.id for _ in index.notebooks()} == {APIDOC, BOILERPLATE}
+        assert [(_.id, _.kind) for _ in index.lookup("html")] == [
+            (BOILERPLATE, DEFINED),
+            (APIDOC, IMPORTED),
+        ]
+    # The index is persisted, and updated incrementally
+    requests = len(api.api.requests)
+    with SymbolIndex(path) as index:
+        assert index.version(BOILERPLATE) == 2228
+        assert symbols_index(index, ["@sebastien/boilerplate"]) == (0, 1)
+        assert len(api.api.requests) == requests
+        notebook = api.load("@sebastien/boilerplate")
+        assert notebook
+        index.add(NotebookRef(BOILERPLATE, 2229), notebook)
+        assert index.version(BOILERPLATE) == 2229
+        index.remove(BOILERPLATE)
+        assert [_.id for _ in index.lookup("html")] == [APIDOC]
+
+
+def test_notebook_ref(observable):
+    notebook = observable().parseFile(str(BASE / "data-notebook-raw.js"))
+    assert notebook
+    assert notebook_ref(notebook) == NotebookRef(BOILERPLATE, 2228)
+
+
+# EOF